@@ -0,0 +1,243 @@
+import cli
+import codes
+import db
+import grouping
+import name_index
+import refdata
+import transfermarkt
+from transfermarkt import Club, Competition, CountryStats, Player, search_players
+
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import click
+from click.testing import CliRunner
+from prettytable import PrettyTable
+
+
+BASELINE_FILE = os.environ.get('BENCH_BASELINE', 'bench_baseline.json')
+BENCH_DB = 'transfermarkt_bench'
+THRESHOLD = 1.25
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ran', 'de', 'sil', 'va', 'ber', 'to', 'ni', 'go', 'mé', 'ül', 'son', 'ez', 'ić', 'ov', 'ra']
+FEET = ['right', 'left', 'both', None]
+CLUB_SUFFIXES = ['FC', 'United', 'City', 'SC', 'Athletic', 'Rovers']
+
+
+def use_mongomock():
+    try:
+        import mongomock
+    except ImportError:
+        raise click.ClickException('The in-memory stand-in requires mongomock (pip install mongomock), or pass --mongo.')
+    db._client = mongomock.MongoClient()
+    db._pid = os.getpid()
+
+
+def get_name(rng, parts):
+    return ' '.join(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize() for _ in range(parts))
+
+
+def format_date(value):
+    return f'{value:%b} {value.day}, {value.year}'
+
+
+def format_market_value(value):
+    if value >= 1_000_000:
+        return f'€{value / 1_000_000:.2f}m'
+    return f'€{value // 1000}k'
+
+
+def make_player(rng, id, nationalities, updated_at):
+    date_of_birth = updated_at.date() - timedelta(days=rng.randint(16 * 365, 38 * 365))
+    joined_on = updated_at.date() - timedelta(days=rng.randint(0, 6 * 365))
+    nationality = [rng.choice(nationalities)]
+    if rng.random() < 0.2:
+        nationality.append(rng.choice(nationalities))
+    player = {
+        'id': str(id),
+        'name': get_name(rng, 2),
+        'position': rng.choice(list(codes.positions.values())),
+        'dateOfBirth': format_date(date_of_birth),
+        'nationality': nationality,
+        'height': f'1,{rng.randint(65, 99)}m',
+        'foot': rng.choice(FEET),
+        'joinedOn': format_date(joined_on),
+        'signedFrom': get_name(rng, 1),
+        'contract': format_date(joined_on + timedelta(days=rng.randint(365, 5 * 365))),
+        'status': 'Team captain' if rng.random() < 0.03 else None
+    }
+    if rng.random() < 0.9:
+        player['marketValue'] = format_market_value(int(rng.lognormvariate(13.5, 1.4)) // 25000 * 25000 + 25000)
+    return dict((k, v) for k, v in player.items() if v is not None)
+
+
+def generate(countries=3, clubs=18, players=28, seed=0):
+    rng = random.Random(seed)
+    reference = refdata.get_countries()
+    names = [i['name'] for i in reference.all if i['competitions']][0:countries]
+    nationalities = list(reference.tm_codes.keys())
+    # transfermarkt-api reports naive ISO timestamps.
+    updated_at = datetime(2024, 1, 15, 10, 30)
+
+    competitions = []
+    rosters = []
+    rows = []
+    club_id = 0
+    player_id = 0
+    for country in names:
+        for competition in reference.competitions[country]:
+            teams = []
+            for _ in range(clubs):
+                club_id += 1
+                name = f'{get_name(rng, 1)} {rng.choice(CLUB_SUFFIXES)}'
+                fetched = (updated_at - timedelta(hours=rng.randint(0, 72))).isoformat()
+                roster = []
+                for _ in range(rng.randint(players - 4, players + 4)):
+                    player_id += 1
+                    roster.append(make_player(rng, player_id, nationalities, updated_at))
+                teams.append({'id': str(club_id), 'name': name})
+                rosters.append({'id': str(club_id), 'updatedAt': fetched, 'players': roster})
+                # Same shape as Player.rows, which mongomock cannot run ($lookup with a pipeline).
+                rows.extend({'club': name, 'club_id': str(club_id), 'competition_id': competition, 'updated_at': fetched, **i} for i in roster)
+            competitions.append({'id': competition, 'name': competition, 'seasonID': '2023', 'clubs': teams})
+    return names, competitions, rosters, rows
+
+
+def load(competitions, rosters, rows):
+    transfermarkt.get_db().client.drop_database(BENCH_DB)
+    Competition().save(*competitions)
+    Club().save(*rosters)
+    Player().save(*Player().format_rows(rows))
+    CountryStats().refresh()
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def get_benchmarks(countries, rows, mongo):
+    country = countries[0]
+    players = Player().from_country(country)
+    filters = {'countries': countries, 'age_max': 23}
+    index_rows = list(name_index.get_rows())
+    index = name_index.NameIndex.build(index_rows)
+    query = index_rows[len(index_rows) // 2]['name']
+
+    prefs = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump({'max_age': 23, 'limit': 100}, prefs)
+    prefs.close()
+    runner = CliRunner()
+
+    def run(*args):
+        result = runner.invoke(cli.cli, list(args))
+        if result.exception:
+            raise result.exception
+
+    benchmarks = {
+        'player.format_row': lambda: [Player().format_row(i) for i in rows],
+        'player.format_rows': lambda: Player().format_rows(rows),
+        'player.from_country': lambda: Player().from_country(country),
+        'search_players': lambda: search_players(**filters),
+        'search_players.limit': lambda: search_players(limit=100, **filters),
+        'grouping.group_top_k': lambda: grouping.group_top_k(players, 'position', k=50),
+        'name_index.build': lambda: name_index.NameIndex.build(index_rows),
+        'name_index.search': lambda: index.search(query),
+        'cli.get_players': lambda: run('get-players', '--prefs', prefs.name, '--format', 'csv', country),
+        'cli.aggregate_positions': lambda: run('aggregate-positions', '--prefs', prefs.name, country),
+        'cli.get_country_stats': lambda: run('get-country-stats', '--format', 'csv')
+    }
+    if mongo:
+        # Needs $lookup with a pipeline, which only a real mongod runs.
+        benchmarks['player.rows'] = lambda: list(Player().rows(Competition().ids_from_country(country)))
+        benchmarks['country_stats.refresh'] = lambda: CountryStats().refresh(*countries)
+    return benchmarks, prefs.name
+
+
+def load_baseline(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+
+
+@click.command
+@click.option('--countries', '-c', default=3)
+@click.option('--clubs', default=18)
+@click.option('--players', '-p', default=28)
+@click.option('--seed', default=0)
+@click.option('--repeat', '-r', default=5)
+@click.option('--mongo', is_flag=True)
+@click.option('--baseline', '-b', default=BASELINE_FILE)
+@click.option('--threshold', '-t', default=THRESHOLD)
+@click.option('--save', is_flag=True)
+@click.option('--only', '-o', multiple=True)
+def main(countries, clubs, players, seed, repeat, mongo, baseline, threshold, save, only):
+    if not mongo:
+        use_mongomock()
+    transfermarkt.DB_NAME = BENCH_DB
+
+    scale = {'countries': countries, 'clubs': clubs, 'players': players, 'seed': seed, 'mongo': mongo}
+    names, competitions, rosters, rows = generate(countries=countries, clubs=clubs, players=players, seed=seed)
+    started = time.perf_counter()
+    load(competitions, rosters, rows)
+    print(f'Loaded {len(rows)} players from {len(rosters)} clubs in {time.perf_counter() - started:.1f}s.')
+
+    stored = load_baseline(baseline)
+    if stored and stored.get('scale') != scale:
+        print(f'Ignoring {baseline}: recorded at scale {stored.get("scale")}.')
+        stored = None
+    stored = stored['results'] if stored else {}
+
+    benchmarks, prefs = get_benchmarks(names, rows, mongo)
+    results = {}
+    regressions = []
+    table = PrettyTable()
+    table.field_names = ['Benchmark', 'Median (ms)', 'Baseline (ms)', 'Ratio', 'Status']
+    try:
+        for name, func in benchmarks.items():
+            if only and not any(name.startswith(i) for i in only):
+                continue
+            func()
+            results[name] = timed(func, repeat)
+            previous = stored.get(name)
+            ratio = results[name] / previous if previous else None
+            status = '-'
+            if ratio is not None:
+                status = 'REGRESSION' if ratio > threshold else 'ok'
+                if ratio > threshold:
+                    regressions.append(name)
+            table.add_row([
+                name,
+                round(results[name] * 1000, 2),
+                round(previous * 1000, 2) if previous else '-',
+                f'{ratio:.2f}x' if ratio else '-',
+                status
+            ])
+    finally:
+        os.remove(prefs)
+        transfermarkt.get_db().client.drop_database(BENCH_DB)
+
+    for i in table.field_names:
+        table.align[i] = 'l'
+    print(table)
+
+    if save:
+        with open(baseline, 'w') as f:
+            json.dump({'scale': scale, 'results': {**stored, **results}}, f, indent=4, sort_keys=True)
+        print(f'Saved baseline to {baseline}.')
+
+    if regressions:
+        raise click.ClickException(f'{len(regressions)} regression(s) over {threshold}x: {", ".join(regressions)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,15 @@
 import codes
-from transfermarkt import Player
+import grouping
+import indexes
+import name_index
+import output
+import refdata
+from transfermarkt import CountryStats, Player, get_db, search_players
 
 
 import json
 import statistics
-from operator import itemgetter
+from itertools import chain
 
 from prettytable import PrettyTable
 import click
@@ -38,9 +43,7 @@ def abbreviate_number(num):
 
 
 def get_tm_names():
-    with open('countries.json') as f:
-        countries = json.load(f)
-        return dict((i['transfermarkt_name'], i['code']) for i in countries)
+    return refdata.get_countries().tm_codes
     
 
 def get_default_table(results):
@@ -77,21 +80,23 @@ def cli():
     pass
 
 
+FORMAT_CHOICES = click.Choice(output.FORMATS)
+
+
 @click.command
-def get_country_stats():
-    with open('countries.json') as f:
-        countries = json.load(f)
+@click.option('--refresh', is_flag=True)
+@click.option('--format', '-f', 'format', default='table', type=FORMAT_CHOICES)
+def get_country_stats(refresh, format):
+    stats = None if refresh else CountryStats().all()
+    if not stats:
+        stats = CountryStats().refresh()
 
-    countries = [i for i in countries if i['competitions']]
-    mvs = {}
-    for country in countries:
-        players = Player().from_country(country['name'])
-        players = [i for i in players if i.get('market_value_number')]
-        mv = [i['market_value_number'] for i in players]
-        mvs[country['name']] = sum(mv)
+    stats = sorted([i for i in stats if i['market_value'] > 0], key=lambda d: -d['market_value'])
+    if format != 'table':
+        output.write_rows(stats, format, fields=['id', 'market_value', 'players'])
+        return
 
-    mvs = sorted(mvs.items(), key=lambda k: -k[-1])
-    mvs = [(k, v) for k, v in mvs if v > 0]
+    mvs = [(i['id'], i['market_value']) for i in stats]
 
     print(*[f'{k}: {abbreviate_number(v)}' for k, v in mvs], sep='\n')
     stats_table = PrettyTable()
@@ -102,44 +107,68 @@ def get_country_stats():
     print(stats_table)
 
 
-@click.command
-@click.option('--partition', '-p', default='position')
-@click.option('--stats', '-s', default=True)
-@click.option('--prefs', default=DEFAULT_PREFS)
-@click.argument('country')
-def get_players(country, prefs, stats):
-    with open(prefs) as f:
-        prefs = json.load(f)
+PARTITION_CHOICES = click.Choice(list(grouping.PARTITIONS.keys()))
 
-    players = Player().from_country(country)
-    players = sorted(players, key=lambda d: -d.get('market_value_number', 0))
-    if max_age := prefs.get('max_age'):
-        max_age = int(max_age)
-        players = [i for i in players if i.get('age', 0) <= max_age]
-
-    if positions := prefs.get('positions'):
-        positions = positions.split(',')
-        players = [i for i in players if i['position'] in itemgetter(*positions)(codes.positions)]
-
-    if limit := prefs.get('limit'):
-        limit = int(limit)
-        players = players[0:limit]
 
+def get_players_table(players):
     table = PrettyTable()
     table.field_names = list(default_keys.values())
     for i in players:
         row = []
         for k in default_keys.keys():
-            row.append(i.get(k))
+            row.append(getattr(i, k))
         table.add_row(row)
 
     for i in table.field_names:
         table.align[i] = 'l'
 
-    print(table)
+    return table
+
+
+def get_max_age(prefs):
+    if max_age := prefs.get('max_age'):
+        return int(max_age)
+
+
+@click.command
+@click.option('--partition', '-p', type=PARTITION_CHOICES)
+@click.option('--stats', '-s', default=True)
+@click.option('--prefs', default=DEFAULT_PREFS)
+@click.option('--format', '-f', 'format', default='table', type=FORMAT_CHOICES)
+@click.argument('country')
+def get_players(country, prefs, stats, partition, format):
+    with open(prefs) as f:
+        prefs = json.load(f)
+
+    filters = {'countries': [country]}
+    if max_age := get_max_age(prefs):
+        filters['age_max'] = max_age
+
+    if positions := prefs.get('positions'):
+        filters['positions'] = positions.split(',')
+
+    limit = prefs.get('limit')
+    if format != 'table':
+        if partition:
+            players = search_players(limit=int(limit) if limit else None, **filters)
+            rows = output.with_partition(grouping.group_top_k(players, partition), partition)
+            output.write_rows(rows, format, fields=output.get_partition_fields(partition))
+        else:
+            rows = search_players(limit=int(limit) if limit else None, stream=True, **filters)
+            output.write_rows(rows, format)
+        return
+
+    players = search_players(limit=int(limit) if limit else None, **filters)
+
+    if partition:
+        for bucket, group in grouping.group_top_k(players, partition).items():
+            print(bucket)
+            print(get_players_table(group))
+    else:
+        print(get_players_table(players))
 
     if stats:
-        mvs = [i.get('market_value_number', 0) for i in players]
+        mvs = [i.market_value_number or 0 for i in players]
         if len(mvs) > 0:
             max_mv = abbreviate_number(max(mvs))
             min_mv = abbreviate_number(min(mvs))
@@ -151,7 +180,7 @@ def get_players(country, prefs, stats):
             print(stats_table)
 
 def get_stats_table(players):
-    mvs = [j for j in [i.get('market_value_number', 0) for i in players] if j > 0]
+    mvs = [j for j in [i.market_value_number or 0 for i in players] if j > 0]
     if len(mvs) != 0:
         q1 = numpy.percentile(mvs, 25)
         q3 = numpy.percentile(mvs, 75)
@@ -167,64 +196,65 @@ def get_stats_table(players):
         stats_table.add_row([n, f'{n_outliers} ({round(n_outliers/n * 100, 2)}%)', f'€{abbreviate_number(mean)}', f'€{abbreviate_number(u_bound)}'])
         return stats_table
 
+def get_samples(country, prefs, size, partition):
+    filters = {'countries': [country]}
+    if max_age := get_max_age(prefs):
+        filters['age_max'] = max_age
+
+    players = search_players(sort_by=None, **filters)
+    return grouping.group_top_k(players, partition, k=size)
+
+
 @click.command
 @click.option('--prefs', '-p', default=DEFAULT_PREFS)
 @click.option('--size', '-s', default=50)
+@click.option('--partition', default='position', type=PARTITION_CHOICES)
+@click.option('--format', '-f', 'format', default='table', type=FORMAT_CHOICES)
 @click.argument('country')
-def sample_position(country, size, prefs):
+def sample_position(country, size, prefs, partition, format):
     with open(prefs) as f:
         prefs = json.load(f)
 
-    players = Player().from_country(country)
-    players = sorted(players, key=lambda d: -d.get('market_value_number', 0))
-    if max_age := prefs.get('max_age'):
-        players = [i for i in players if i.get('age', 0) <= max_age]
-    position_list = list(codes.positions.keys())
-    for p_code in position_list:
-        p = codes.positions[p_code]
-        players_sample = [i for i in players if i['position'] == p]
-        if players_sample:
-            print(p)
-            players_sample = players_sample[0:size]
-
-            table = PrettyTable()
-            table.field_names = list(default_keys.keys())
-            for player in players_sample:
-                table.add_row([player.get(f, '-') for f in table.field_names])
-            
-            for i in table.field_names:
-                table.align[i] = 'l'
-            print(table)
-
-            stats_table = get_stats_table(players_sample)
-            print(stats_table)
+    samples = get_samples(country, prefs, size, partition)
+    if format != 'table':
+        output.write_rows(output.with_partition(samples, partition), format, fields=output.get_partition_fields(partition))
+        return
+
+    for bucket, players_sample in samples.items():
+        print(bucket)
+
+        table = PrettyTable()
+        table.field_names = list(default_keys.keys())
+        for player in players_sample:
+            table.add_row([player.get(f, '-') for f in table.field_names])
+        
+        for i in table.field_names:
+            table.align[i] = 'l'
+        print(table)
+
+        stats_table = get_stats_table(players_sample)
+        print(stats_table)
 
 
 @click.command
 @click.option('--skip', default=True)
 @click.option('--prefs', '-p', default=DEFAULT_PREFS)
 @click.option('--size', '-s', default=50)
+@click.option('--partition', default='position', type=PARTITION_CHOICES)
+@click.option('--format', '-f', 'format', default='table', type=FORMAT_CHOICES)
 @click.argument('country')
-def aggregate_positions(country, size, prefs, skip):
+def aggregate_positions(country, size, prefs, skip, partition, format):
     with open(prefs) as f:
         prefs = json.load(f)
 
-    players = Player().from_country(country)
-    if max_age := prefs.get('max_age'):
-        players = [i for i in players if i.get('age', 0) <= max_age]
-
-    position_list = list(codes.positions.keys())
-    all_samples = []
-    for pc in position_list:
-        p = codes.positions[pc]
-        players_sample = [i for i in players if i['position'] == p]
-        if players_sample:
-            players_sample = players_sample[0:size]
-            all_samples.extend(players_sample)
-
-    all_samples = sorted(all_samples, key=lambda d: -d.get('market_value_number', 0))
+    all_samples = list(chain(*get_samples(country, prefs, size, partition).values()))
+    all_samples = sorted(all_samples, key=lambda d: -(d.market_value_number or 0))
     if skip:
-        all_samples = [i for i in all_samples if i.get('market_value_number')]
+        all_samples = [i for i in all_samples if i.market_value_number]
+
+    if format != 'table':
+        output.write_rows(all_samples, format)
+        return
     
     table = get_default_table(all_samples)
     print(table)
@@ -233,10 +263,83 @@ def aggregate_positions(country, size, prefs, skip):
     print(stats_table)
 
 
+@click.command
+@click.argument('countries', nargs=-1)
+def sync_players(countries):
+    clubs = Player().sync(*countries)
+    print(f'Synced {len(clubs)} clubs.')
+
+
+@click.command
+@click.option('--limit', '-l', default=100)
+@click.option('--type', '-t', 'types', multiple=True, type=click.Choice(['joined', 'left', 'changed']))
+@click.option('--format', '-f', 'format', default='table', type=FORMAT_CHOICES)
+def roster_changes(limit, types, format):
+    query = {'type': {'$in': list(types)}} if types else {}
+    changes = get_db()['roster_changes'].find(query, {'_id': 0}).sort('detectedAt', -1).limit(limit)
+    fields = ['detectedAt', 'type', 'club_id', 'player_id', 'name', 'fields']
+    if format != 'table':
+        output.write_rows(changes, format, fields=fields)
+        return
+
+    table = PrettyTable()
+    table.field_names = fields
+    for i in changes:
+        table.add_row([i.get(f, '-') for f in fields])
+
+    for i in table.field_names:
+        table.align[i] = 'l'
+
+    print(table)
+
+
+@click.command
+@click.option('--limit', '-l', default=10)
+@click.option('--rebuild', is_flag=True)
+@click.argument('query')
+def search_name(query, limit, rebuild):
+    if rebuild:
+        name_index.get_name_index(rebuild=True)
+
+    table = PrettyTable()
+    table.field_names = ['Score', *default_keys.keys()]
+    for i in name_index.search_names(query, limit=limit):
+        table.add_row([round(i['score'], 2), *[i.get(k, '-') for k in default_keys.keys()]])
+
+    for i in table.field_names:
+        table.align[i] = 'l'
+
+    print(table)
+
+
+@click.command
+def init_indexes():
+    for i in indexes.ensure_indexes():
+        print(i)
+
+
+@click.command
+def check_indexes():
+    table = PrettyTable()
+    table.field_names = ['Query', 'Collection', 'Scan', 'Plan']
+    for name, collection, scan, plan in indexes.check_queries():
+        table.add_row([name, collection, 'COLLSCAN' if scan else '-', plan])
+
+    for i in table.field_names:
+        table.align[i] = 'l'
+
+    print(table)
+
+
 cli.add_command(get_country_stats)
 cli.add_command(get_players)
 cli.add_command(sample_position)
 cli.add_command(aggregate_positions)
+cli.add_command(sync_players)
+cli.add_command(roster_changes)
+cli.add_command(search_name)
+cli.add_command(init_indexes)
+cli.add_command(check_indexes)
 
 if __name__ == '__main__':
     cli()
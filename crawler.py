@@ -0,0 +1,116 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import requests
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, url=None):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, url):
+        host = urlparse(url).netloc or url
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if not bucket:
+                bucket = TokenBucket(self.rate, self.capacity)
+                self.buckets[host] = bucket
+        bucket.acquire()
+
+
+class Progress:
+    def __init__(self, total, label='items', interval=10):
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.reported = self.started
+        self.lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.done + self.skipped + self.failed
+
+    def update(self, status):
+        with self.lock:
+            setattr(self, status, getattr(self, status) + 1)
+            now = time.monotonic()
+            if now - self.reported >= self.interval or self.finished == self.total:
+                self.reported = now
+                self.report()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        rate = self.finished / elapsed
+        queue = self.total - self.finished
+        print(f'[{self.finished}/{self.total}] {rate:.2f} {self.label}/s, '
+              f'queue {queue}, saved {self.done}, skipped {self.skipped}, failures {self.failed}')
+
+
+def crawl(jobs, fetch, save, workers=4, progress=None, mark=None):
+    jobs = list(jobs)
+    progress = progress or Progress(len(jobs))
+    mark = mark or (lambda job, status, error=None: None)
+    failures = []
+
+    def fail(job, message, error):
+        print(f'Failed for {job[0]} ({message})')
+        failures.append(job)
+        mark(job, 'failed', str(error))
+        progress.update('failed')
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = dict((executor.submit(fetch, *job), job) for job in jobs)
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                save(job, future.result())
+                mark(job, 'done')
+                progress.update('done')
+            except requests.exceptions.HTTPError as err:
+                status = int(err.response.status_code)
+                if status == 404:
+                    print(f'Skipping for {job[0]}')
+                    mark(job, 'skipped')
+                    progress.update('skipped')
+                else:
+                    fail(job, status, err)
+            except requests.exceptions.RequestException as err:
+                fail(job, err, err)
+            except Exception as err:
+                # A bad payload or a database error fails this job only, not the whole crawl.
+                fail(job, repr(err), err)
+    finally:
+        # On an interrupt, drop the queued fetches instead of running them all before exiting.
+        executor.shutdown(wait=True, cancel_futures=True)
+    return failures
@@ -0,0 +1,28 @@
+import os
+import threading
+
+from pymongo import MongoClient
+
+
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
+MONGO_POOL_SIZE = int(os.environ.get('MONGO_POOL_SIZE', 100))
+
+_client = None
+_pid = None
+_lock = threading.Lock()
+
+
+def get_client():
+    global _client, _pid
+    pid = os.getpid()
+    if _client is None or _pid != pid:
+        with _lock:
+            if _client is None or _pid != pid:
+                # A client inherited across fork() is unusable in the child, so build a new one.
+                _client = MongoClient(MONGO_URI, maxPoolSize=MONGO_POOL_SIZE, connect=False)
+                _pid = pid
+    return _client
+
+
+def get_db(name):
+    return get_client()[name]
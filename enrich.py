@@ -0,0 +1,97 @@
+from transfermarkt import API, Competition, get_db
+from crawler import Progress, RateLimiter, crawl
+
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+
+import click
+
+
+HASH_FIELDS = ('club_id', 'marketValue', 'position', 'nationality')
+
+# source: (collection, fetch, default stale days)
+SOURCES = {
+    'profile': ('player_profiles', lambda api, id: api.get_player(id), 30),
+    'stats': ('player_stats', lambda api, id: api.get_player_stats(id), 7)
+}
+
+PRIORITIES = ['value', 'stale']
+
+
+def get_player_hash(player):
+    values = [player.get(i) for i in HASH_FIELDS]
+    return hashlib.sha256(json.dumps(values, default=str).encode()).hexdigest()
+
+
+def get_players(countries=()):
+    query = {}
+    if countries:
+        query['competition_id'] = {'$in': list(chain(*[Competition().ids_from_country(i) for i in countries]))}
+    projection = dict([('_id', 0), ('id', 1), ('market_value_number', 1)] + [(i, 1) for i in HASH_FIELDS])
+    return get_db()['players'].find(query, projection)
+
+
+def plan(source, players, priority='value', stale_days=None, limit=None):
+    collection, _, default_stale_days = SOURCES[source]
+    stale_days = default_stale_days if stale_days is None else stale_days
+    stale_before = (datetime.now(timezone.utc) - timedelta(days=stale_days)).isoformat()
+
+    players = dict((i['id'], i) for i in players)
+    fetched = get_db()[collection].find({'id': {'$in': list(players)}}, {'id': 1, 'player_hash': 1, 'fetchedAt': 1})
+    fetched = dict((i['id'], i) for i in fetched)
+
+    jobs = []
+    for id, player in players.items():
+        player_hash = get_player_hash(player)
+        entry = fetched.get(id) or {}
+        fetched_at = entry.get('fetchedAt') or ''
+        if entry.get('player_hash') == player_hash and fetched_at >= stale_before:
+            continue
+        jobs.append((id, player_hash, player.get('market_value_number') or 0, fetched_at))
+
+    if priority == 'value':
+        jobs = sorted(jobs, key=lambda i: -i[2])
+    else:
+        jobs = sorted(jobs, key=lambda i: i[3])
+    return [(id, player_hash) for id, player_hash, _, _ in jobs[0:limit]]
+
+
+def enrich(source, players, priority='value', stale_days=None, limit=None, workers=4, limiter=None):
+    api = API()
+    limiter = limiter or RateLimiter(1.0)
+    collection, get, _ = SOURCES[source]
+    table = get_db()[collection]
+    jobs = plan(source, players, priority=priority, stale_days=stale_days, limit=limit)
+
+    def fetch(id, player_hash):
+        limiter.acquire(api.host)
+        return get(api, id)
+
+    def save(job, response):
+        id, player_hash = job
+        fetched_at = datetime.now(timezone.utc).isoformat()
+        table.replace_one({'id': id}, {**response, 'id': id, 'player_hash': player_hash, 'fetchedAt': fetched_at}, upsert=True)
+
+    return crawl(jobs, fetch, save, workers=workers, progress=Progress(len(jobs), label=collection))
+
+
+@click.command
+@click.option('--source', '-s', 'sources', multiple=True, type=click.Choice(list(SOURCES.keys())))
+@click.option('--priority', '-p', default='value', type=click.Choice(PRIORITIES))
+@click.option('--stale-days', type=int)
+@click.option('--limit', '-l', type=int)
+@click.option('--workers', '-w', default=4)
+@click.option('--rate', '-r', default=1.0)
+@click.argument('countries', nargs=-1)
+def main(countries, sources, priority, stale_days, limit, workers, rate):
+    players = list(get_players(countries))
+    limiter = RateLimiter(rate)
+    for source in sources or SOURCES.keys():
+        failures = enrich(source, players, priority=priority, stale_days=stale_days, limit=limit, workers=workers, limiter=limiter)
+        print(f'{source}: {len(failures)} failed')
+
+
+if __name__ == '__main__':
+    main()
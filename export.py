@@ -0,0 +1,247 @@
+import fotmob
+import refdata
+from output import chunked
+from transfermarkt import Club, Competition, Player, parse_date
+
+import json
+import os
+import re
+import shutil
+from datetime import date, datetime
+from functools import lru_cache
+
+import click
+import pyarrow
+import pyarrow.parquet
+
+
+SNAPSHOT_DIR = 'snapshot'
+CHUNK_SIZE = 10000
+
+
+def category(index_type=pyarrow.int16()):
+    return pyarrow.dictionary(index_type, pyarrow.string())
+
+
+PLAYER_SCHEMA = pyarrow.schema([
+    ('id', pyarrow.string()),
+    ('name', pyarrow.string()),
+    ('name_decoded', pyarrow.string()),
+    ('first_name', pyarrow.string()),
+    ('last_name', pyarrow.string()),
+    ('position', category(pyarrow.int8())),
+    ('age', pyarrow.int16()),
+    ('date_of_birth', pyarrow.date32()),
+    ('nationality', pyarrow.list_(pyarrow.string())),
+    ('nationality1', category()),
+    ('nationality2', category()),
+    ('club', pyarrow.string()),
+    ('club_id', pyarrow.string()),
+    ('competition_id', category()),
+    ('marketValue', pyarrow.string()),
+    ('market_value_number', pyarrow.float64()),
+    ('height', pyarrow.string()),
+    ('height_cm', pyarrow.float32()),
+    ('foot', category(pyarrow.int8())),
+    ('joined_on', pyarrow.date32()),
+    ('updated_at', pyarrow.timestamp('s'))
+])
+
+CLUB_SCHEMA = pyarrow.schema([
+    ('id', pyarrow.string()),
+    ('name', pyarrow.string()),
+    ('competition_id', category()),
+    ('updated_at', pyarrow.timestamp('s')),
+    ('players', pyarrow.int32()),
+    ('market_value_number', pyarrow.float64())
+])
+
+
+@lru_cache(maxsize=None)
+def parse_height_cm(height):
+    height_m = re.search(r'(\d+,\d+)m', height)
+    if height_m:
+        return round(float(height_m.group(1).replace(',', '.')) * 100, 1)
+
+
+def to_date(value):
+    if value:
+        return date(*parse_date(value))
+
+
+def to_timestamp(value):
+    if value:
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+
+
+def get_player_row(player):
+    return {
+        'id': player['id'],
+        'name': player.get('name'),
+        'name_decoded': player.get('name_decoded'),
+        'first_name': player.get('first_name'),
+        'last_name': player.get('last_name'),
+        'position': player.get('position'),
+        'age': player.get('age'),
+        'date_of_birth': to_date(player.get('dateOfBirth')),
+        'nationality': player.get('nationality'),
+        'nationality1': player.get('nationality1'),
+        'nationality2': player.get('nationality2'),
+        'club': player.get('club'),
+        'club_id': player.get('club_id'),
+        'competition_id': player.get('competition_id'),
+        'marketValue': player.get('marketValue'),
+        'market_value_number': player.get('market_value_number'),
+        'height': player.get('height'),
+        'height_cm': parse_height_cm(player['height']) if player.get('height') else None,
+        'foot': player.get('foot'),
+        'joined_on': to_date(player.get('joinedOn')),
+        'updated_at': to_timestamp(player.get('updated_at'))
+    }
+
+
+def get_partition_dir(root, dataset, **partitions):
+    parts = [f'{k}={v}' for k, v in partitions.items()]
+    return os.path.join(root, dataset, *parts)
+
+
+class PartitionWriter:
+    def __init__(self, root, dataset, schema):
+        self.root = root
+        self.dataset = dataset
+        self.schema = schema
+        self.writers = {}
+
+    def write(self, rows, **partitions):
+        key = tuple(partitions.items())
+        writer = self.writers.get(key)
+        if writer is None:
+            path = get_partition_dir(self.root, self.dataset, **partitions)
+            os.makedirs(path, exist_ok=True)
+            writer = pyarrow.parquet.ParquetWriter(os.path.join(path, 'part-0.parquet'), self.schema)
+            self.writers[key] = writer
+        writer.write_table(pyarrow.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+def clear_partition(root, dataset, **partitions):
+    path = get_partition_dir(root, dataset, **partitions)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+
+def get_seasons(competitions):
+    return dict((i['id'], str(i.get('seasonID'))) for i in Competition().table.find(
+        {'id': {'$in': competitions}}, {'id': 1, 'seasonID': 1}
+    ))
+
+
+def export_players(countries, root=SNAPSHOT_DIR):
+    total = 0
+    for country in countries:
+        competitions = Competition().ids_from_country(country)
+        seasons = get_seasons(competitions)
+        clear_partition(root, 'players', country=country)
+        writer = PartitionWriter(root, 'players', PLAYER_SCHEMA)
+        try:
+            cursor = Player().table.find({'competition_id': {'$in': competitions}}, {'_id': 0})
+            for chunk in chunked(cursor, CHUNK_SIZE):
+                by_season = {}
+                for i in chunk:
+                    by_season.setdefault(seasons.get(i.get('competition_id')), []).append(get_player_row(i))
+                for season, rows in by_season.items():
+                    writer.write(rows, country=country, season=season)
+                total += len(chunk)
+        finally:
+            writer.close()
+        print(f'Exported players for {country}.')
+    return total
+
+
+def export_clubs(countries, root=SNAPSHOT_DIR):
+    pipeline = [
+        {'$project': {
+            '_id': 0,
+            'id': 1,
+            'updatedAt': 1,
+            'players': {'$size': {'$ifNull': ['$players', []]}}
+        }}
+    ]
+    total = 0
+    for country in countries:
+        competitions = Competition().table.find(
+            {'id': {'$in': Competition().ids_from_country(country)}}, {'id': 1, 'seasonID': 1, 'clubs': 1}
+        )
+        competitions = list(competitions)
+        ids = [j['id'] for i in competitions for j in i.get('clubs', [])]
+        clubs = dict((i['id'], i) for i in Club().table.aggregate([{'$match': {'id': {'$in': ids}}}, *pipeline]))
+        market_values = dict((i['_id'], i['market_value_number']) for i in Player().table.aggregate([
+            {'$match': {'club_id': {'$in': ids}}},
+            {'$group': {'_id': '$club_id', 'market_value_number': {'$sum': '$market_value_number'}}}
+        ]))
+
+        clear_partition(root, 'clubs', country=country)
+        writer = PartitionWriter(root, 'clubs', CLUB_SCHEMA)
+        try:
+            for competition in competitions:
+                rows = []
+                for i in competition.get('clubs', []):
+                    club = clubs.get(i['id'], {})
+                    rows.append({
+                        'id': i['id'],
+                        'name': i.get('name'),
+                        'competition_id': competition['id'],
+                        'updated_at': to_timestamp(club.get('updatedAt')),
+                        'players': club.get('players'),
+                        'market_value_number': market_values.get(i['id'])
+                    })
+                if rows:
+                    writer.write(rows, country=country, season=str(competition.get('seasonID')))
+                    total += len(rows)
+        finally:
+            writer.close()
+    return total
+
+
+def get_totw_row(team, player):
+    row = {'league_id': team['league_id'], 'round_id': str(team['round_id'])}
+    for k, v in player.items():
+        row[k] = v if v is None or isinstance(v, (str, int, float, bool)) else json.dumps(v, default=str)
+    return row
+
+
+def export_totw(root=SNAPSHOT_DIR):
+    leagues = refdata.get_leagues()
+    table = fotmob.get_db()['totw_team']
+    total = 0
+    for key in table.aggregate([{'$group': {'_id': {'league_id': '$league_id', 'season': '$season'}}}]):
+        league_id, season = key['_id']['league_id'], key['_id']['season']
+        country = leagues.league_country.get(league_id, 'Unknown')
+        season_dir = str(season).replace('/', '-')
+        rows = [get_totw_row(i, j) for i in table.find({'league_id': league_id, 'season': season}) for j in i['players']]
+        if rows:
+            path = get_partition_dir(root, 'totw', country=country, season=season_dir)
+            os.makedirs(path, exist_ok=True)
+            pyarrow.parquet.write_table(pyarrow.Table.from_pylist(rows), os.path.join(path, f'league-{league_id}.parquet'))
+            total += len(rows)
+    return total
+
+
+@click.command
+@click.option('--output', '-o', default=SNAPSHOT_DIR)
+@click.option('--totw/--no-totw', default=True)
+@click.argument('countries', nargs=-1)
+def main(countries, output, totw):
+    countries = countries or [i['name'] for i in refdata.get_countries().all if i['competitions']]
+    print(f'Exported {export_players(countries, root=output)} players.')
+    print(f'Exported {export_clubs(countries, root=output)} clubs.')
+    if totw:
+        print(f'Exported {export_totw(root=output)} TOTW rows.')
+
+
+if __name__ == '__main__':
+    main()
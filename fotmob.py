@@ -1,48 +1,51 @@
 import json
 import os
+from datetime import datetime, timezone
 from itertools import chain
 from operator import itemgetter
 
-import requests
-from pymongo import MongoClient
+import db
+import http_client
+import refdata
+from crawler import Progress, RateLimiter, crawl
 
-leagues_file = 'leagues.json'
+leagues_file = refdata.LEAGUES_FILE
+
+
+DB_NAME = 'fotmob'
+WORKERS = int(os.environ.get('FOTMOB_WORKERS', 4))
+RATE = float(os.environ.get('FOTMOB_RATE', 2.0))
 
 
 def get_db():
-    client = MongoClient('localhost', 27017)
-    return client['fotmob']
+    return db.get_db(DB_NAME)
 
 
 class API:
-    def __init__(self):
+    def __init__(self, timeout=None, cache=None):
         self.host = 'https://www.fotmob.com/api'
+        self.timeout = timeout
+        self.cache = cache
+
+    def get(self, path, params=None):
+        return http_client.get(f'{self.host}{path}', params=params, timeout=self.timeout, cache=self.cache)
 
     def get_all_leagues(self):
-        response = requests.get(f'{self.host}/allLeagues')
-        response.raise_for_status()
-        return response.json()
+        return self.get('/allLeagues')
 
     def get_league(self, league_id):
-        response = requests.get(f'{self.host}/leagues', params={'id': league_id})
-        response.raise_for_status()
-        return response.json()
+        return self.get('/leagues', params={'id': league_id})
     
     def get_fixtures(self, league_id, season):
-        response = requests.get(f'{self.host}/fixtures', params={'id': league_id, 'season': season})
-        response.raise_for_status()
-        return response.json()
+        return self.get('/fixtures', params={'id': league_id, 'season': season})
     
     def get_player(self, player_id):
-        response = requests.get(f'{self.host}/playerData', params={'id': player_id})
-        response.raise_for_status()
-        return response.json()
+        return self.get('/playerData', params={'id': player_id})
 
 
 def get_all_leagues():
     if os.path.exists(leagues_file):
-        with open(leagues_file) as f:
-            return json.load(f)
+        return refdata.get_leagues().all
         
     leagues = API().get_all_leagues()
     leagues = list(chain(*itemgetter('international', 'countries')(leagues)))
@@ -52,20 +55,27 @@ def get_all_leagues():
     return leagues
     
 
+def make_league(league_id, response):
+    stats = response['stats'] or {}
+    return {'id': league_id, 'seasons': response['allAvailableSeasons'], 'stat_links': stats.get('seasonStatLinks', [])}
+
+
 def get_league(league_id):
-    ids = list(chain(*[[j['id'] for j in i['leagues']] for i in get_all_leagues()]))
-    if league_id in ids:
+    get_all_leagues()
+    if league_id in refdata.get_leagues().ids:
         table = get_db()['leagues']
         league = table.find_one({'id': league_id})
         if not league:
-            league = API().get_league(league_id)
-            seasons = league['allAvailableSeasons']
-            stats = league['stats'] or {}
-            stat_links = stats.get('seasonStatLinks', [])
-            league = {'id': league_id, 'seasons': seasons, 'stat_links': stat_links}
+            league = make_league(league_id, API().get_league(league_id))
             table.insert_one(league)
         return league
-    
+
+
+def get_totw_rounds_link(league, season):
+    totw_info = [i for i in league['stat_links'] if i['Name'] == season]
+    if len(totw_info) == 1:
+        return totw_info[0]['TotwRoundsLink']
+
 
 def get_totw_rounds(league_id, season):
     league = get_league(league_id)
@@ -74,33 +84,67 @@ def get_totw_rounds(league_id, season):
         query = {'league_id': league_id, 'season': season}
         totw_rounds = table.find_one(query)
         if not totw_rounds:
-            totw_info = [i for i in league['stat_links'] if i['Name'] == season]
-            if len(totw_info) == 1:
-                url = totw_info[0]['TotwRoundsLink']
-                response = requests.get(url)
-                response.raise_for_status()
-                totw_rounds = response.json()
+            if url := get_totw_rounds_link(league, season):
+                totw_rounds = http_client.get(url)
                 totw_rounds = {**query, 'rounds': totw_rounds['rounds']}
                 table.insert_one(totw_rounds)
         return totw_rounds
-    
 
-def get_totw_teams(league_id, season):
-    totw_rounds = get_totw_rounds(league_id, season)['rounds']
-    table = get_db()['totw_team']
+
+def get_missing_rounds(league_id, season):
+    totw_rounds = get_totw_rounds(league_id, season)
+    if not totw_rounds:
+        return []
     query = {'league_id': league_id, 'season': season}
-    totw_teams = table.find(query)
-    missing_rounds = {i['roundId'] for i in totw_rounds} - {i['round_id'] for i in totw_teams}
-    if len(missing_rounds) > 0:
-        teams = []
-        for i in totw_rounds:
-            round_id, link = itemgetter('roundId', 'link')(i)
-            if round_id in missing_rounds:
-                print(f'Fetching team from {link}')
-                team = requests.get(link).json()
-                teams.append({**query, 'round_id': round_id, 'players': team['players']})
-        table.insert_many(teams)
-    return list(table.find(query))
+    saved = {i['round_id'] for i in get_db()['totw_team'].find(query, {'round_id': 1})}
+    return [(i['link'], league_id, season, i['roundId']) for i in totw_rounds['rounds'] if i['roundId'] not in saved]
+
+
+def save_totw_team(league_id, season, round_id, team):
+    query = {'league_id': league_id, 'season': season, 'round_id': round_id}
+    get_db()['totw_team'].replace_one(query, {**query, 'players': team['players']}, upsert=True)
+
+
+def fetch_totw_teams(jobs, workers=WORKERS, limiter=None):
+    limiter = limiter or RateLimiter(RATE)
+
+    def fetch(link, *_):
+        limiter.acquire(link)
+        return http_client.get(link)
+
+    def save(job, team):
+        _, league_id, season, round_id = job
+        save_totw_team(league_id, season, round_id, team)
+
+    return crawl(jobs, fetch, save, workers=workers, progress=Progress(len(jobs), label='rounds'))
+
+
+def sync_totw_teams(pairs, workers=WORKERS, rate=RATE):
+    jobs = list(chain(*[get_missing_rounds(league_id, season) for league_id, season in pairs]))
+    return fetch_totw_teams(jobs, workers=workers, limiter=RateLimiter(rate))
+
+
+def get_totw_teams(league_id, season):
+    sync_totw_teams([(league_id, season)])
+    return list(get_db()['totw_team'].find({'league_id': league_id, 'season': season}))
+
+
+def sync_player_profiles(ids, workers=WORKERS, rate=RATE):
+    api = API()
+    table = get_db()['players']
+    saved = {i['id'] for i in table.find({'id': {'$in': list(ids)}}, {'id': 1})}
+    jobs = [(i,) for i in ids if i not in saved]
+    limiter = RateLimiter(rate)
+
+    def fetch(player_id):
+        limiter.acquire(api.host)
+        return api.get_player(player_id)
+
+    def save(job, response):
+        fetched_at = datetime.now(timezone.utc).isoformat()
+        table.replace_one({'id': job[0]}, {**response, 'id': job[0], 'fetchedAt': fetched_at}, upsert=True)
+
+    return crawl(jobs, fetch, save, workers=workers, progress=Progress(len(jobs), label='players'))
 
 
 def get_totw_players(league_id, season):
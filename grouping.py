@@ -0,0 +1,59 @@
+import codes
+
+import heapq
+from itertools import count
+
+
+AGE_BANDS = [(19, 'U19'), (21, 'U21'), (23, 'U23'), (27, '24-27'), (31, '28-31')]
+
+
+def get_age_band(player):
+    age = player.age
+    if age is None:
+        return None
+    for limit, band in AGE_BANDS:
+        if age <= limit:
+            return band
+    return '32+'
+
+
+PARTITIONS = {
+    'position': lambda d: d.position,
+    'club': lambda d: d.club,
+    'nationality': lambda d: d.nationality1,
+    'age_band': get_age_band
+}
+
+
+def get_bucket_order(partition, buckets):
+    if partition == 'position':
+        order = list(codes.positions.values())
+        return sorted(buckets, key=lambda b: order.index(b) if b in order else len(order))
+    if partition == 'age_band':
+        order = [b for _, b in AGE_BANDS] + ['32+']
+        return sorted(buckets, key=lambda b: order.index(b) if b in order else len(order))
+    return sorted(buckets, key=lambda b: (b is None, str(b)))
+
+
+def market_value(player):
+    return player.market_value_number or 0
+
+
+def group_top_k(players, partition='position', k=None, key=market_value):
+    get_bucket = PARTITIONS[partition]
+    counter = count()
+    heaps = {}
+    for player in players:
+        heap = heaps.setdefault(get_bucket(player), [])
+        # Ties keep the earliest player, matching a stable sort by descending key.
+        item = (key(player), -next(counter), player)
+        if k is None or len(heap) < k:
+            heapq.heappush(heap, item)
+        elif item[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, item)
+
+    groups = {}
+    for bucket in get_bucket_order(partition, heaps):
+        items = sorted(heaps[bucket], key=lambda i: i[:2], reverse=True)
+        groups[bucket] = [i[2] for i in items]
+    return groups
@@ -0,0 +1,67 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import response_cache
+
+
+TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 10))
+RETRIES = int(os.environ.get('HTTP_RETRIES', 5))
+BACKOFF = float(os.environ.get('HTTP_BACKOFF', 0.5))
+POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 16))
+
+_session = None
+_lock = threading.Lock()
+
+
+def make_session(retries=RETRIES, backoff=BACKOFF, pool_size=POOL_SIZE):
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        backoff_jitter=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET',),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = make_session()
+    return _session
+
+
+def get(url, params=None, timeout=None, cache=None):
+    if cache is None:
+        cache = response_cache.get_default()
+
+    headers = {}
+    entry = None
+    if cache:
+        entry = cache.get(url, params)
+        if entry:
+            if entry.fresh:
+                return entry.json()
+            headers = entry.validators()
+
+    response = get_session().get(url, params=params, headers=headers, timeout=timeout or TIMEOUT)
+    if entry and response.status_code == 304:
+        cache.refresh(url, params)
+        return entry.json()
+
+    response.raise_for_status()
+    if cache:
+        cache.put(url, params, response)
+    return response.json()
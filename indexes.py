@@ -0,0 +1,116 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.collation import Collation
+
+import db
+
+
+NAME_COLLATION = Collation(locale='en', strength=1)
+
+INDEXES = {
+    'transfermarkt': {
+        'competitions': [
+            IndexModel([('id', ASCENDING)], unique=True)
+        ],
+        'clubs': [
+            IndexModel([('id', ASCENDING)], unique=True)
+        ],
+        'players': [
+            IndexModel([('id', ASCENDING)], unique=True),
+            IndexModel([('position', ASCENDING), ('market_value_number', DESCENDING), ('age', ASCENDING)]),
+            IndexModel([('club_id', ASCENDING), ('market_value_number', DESCENDING), ('age', ASCENDING)]),
+            IndexModel([('competition_id', ASCENDING), ('market_value_number', DESCENDING), ('age', ASCENDING)]),
+            IndexModel([('market_value_number', DESCENDING), ('age', ASCENDING)]),
+            IndexModel([('name_decoded', ASCENDING)], collation=NAME_COLLATION)
+        ],
+        'roster_changes': [
+            IndexModel([('detectedAt', DESCENDING)]),
+            IndexModel([('player_id', ASCENDING), ('detectedAt', DESCENDING)])
+        ],
+        'country_stats': [
+            IndexModel([('id', ASCENDING)], unique=True)
+        ],
+        'player_sync': [
+            IndexModel([('club_id', ASCENDING)], unique=True),
+            IndexModel([('syncedAt', DESCENDING)])
+        ],
+        'player_profiles': [
+            IndexModel([('id', ASCENDING)], unique=True)
+        ],
+        'player_stats': [
+            IndexModel([('id', ASCENDING)], unique=True)
+        ],
+        'player_crosswalk': [
+            IndexModel([('fotmob_id', ASCENDING)], unique=True),
+            IndexModel([('tm_id', ASCENDING)])
+        ],
+        'crawl_journal': [
+            IndexModel([('journal', ASCENDING), ('kind', ASCENDING), ('key', ASCENDING)], unique=True),
+            IndexModel([('journal', ASCENDING), ('kind', ASCENDING), ('status', ASCENDING)])
+        ]
+    },
+    'fotmob': {
+        'leagues': [
+            IndexModel([('id', ASCENDING)], unique=True)
+        ],
+        'totw_rounds': [
+            IndexModel([('league_id', ASCENDING), ('season', ASCENDING)], unique=True)
+        ],
+        'totw_team': [
+            IndexModel([('league_id', ASCENDING), ('season', ASCENDING), ('round_id', ASCENDING)], unique=True)
+        ],
+        'players': [
+            IndexModel([('id', ASCENDING)], unique=True)
+        ]
+    }
+}
+
+
+# Query shapes issued by cli.py, transfermarkt.py and fotmob.py: (name, db, collection, filter, sort, collation).
+QUERIES = [
+    ('record.find', 'transfermarkt', 'clubs', {'id': {'$in': [0]}}, None, None),
+    ('search_players.age', 'transfermarkt', 'players',
+     {'age': {'$lte': 23}}, ('market_value_number', -1), None),
+    ('search_players.position', 'transfermarkt', 'players',
+     {'position': {'$in': ['Centre-Back']}, 'age': {'$lte': 23}}, ('market_value_number', -1), None),
+    ('search_players.club', 'transfermarkt', 'players',
+     {'club_id': {'$in': ['0']}, 'market_value_number': {'$gte': 1}}, ('market_value_number', -1), None),
+    ('get_players', 'transfermarkt', 'players',
+     {'competition_id': {'$in': ['GB1', 'GB2']}, 'age': {'$lte': 23}}, ('market_value_number', -1), None),
+    ('player.from_country', 'transfermarkt', 'players', {'competition_id': {'$in': ['GB1']}}, None, None),
+    ('search_by_name', 'transfermarkt', 'players', {'name_decoded': 'Kylian Mbappe'}, None, NAME_COLLATION),
+    ('fotmob.leagues', 'fotmob', 'leagues', {'id': 47}, None, None),
+    ('fotmob.totw_rounds', 'fotmob', 'totw_rounds', {'league_id': 47, 'season': '2023/2024'}, None, None),
+    ('fotmob.totw_team', 'fotmob', 'totw_team', {'league_id': 47, 'season': '2023/2024'}, None, None)
+]
+
+
+def ensure_indexes():
+    created = []
+    for db_name, collections in INDEXES.items():
+        database = db.get_db(db_name)
+        for name, indexes in collections.items():
+            names = database[name].create_indexes(indexes)
+            created.extend(f'{db_name}.{name}.{i}' for i in names)
+    return created
+
+
+def get_stages(plan):
+    stages = [plan.get('stage')]
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            stages.extend(get_stages(plan[key]))
+    for child in plan.get('inputStages', []):
+        stages.extend(get_stages(child))
+    return stages
+
+
+def check_queries():
+    report = []
+    for name, db_name, collection, query, sort, collation in QUERIES:
+        cursor = db.get_db(db_name)[collection].find(query, collation=collation)
+        if sort:
+            cursor = cursor.sort(*sort)
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        stages = [i for i in get_stages(plan) if i]
+        report.append((name, f'{db_name}.{collection}', 'COLLSCAN' in stages, '>'.join(reversed(stages))))
+    return report
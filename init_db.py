@@ -1,152 +1,212 @@
-from transfermarkt import API, Club, Competition
-import random
-import time
-import requests
+from transfermarkt import API, Club, Competition, Player
+from crawler import RateLimiter, Progress, crawl
+from journal import Journal
 
-def save_countries(countries):
+from datetime import datetime, timedelta, timezone
+
+import click
+
+
+JOURNAL_NAME = 'init_db'
+MAX_ATTEMPTS = 3
+
+
+def get_unsaved_clubs(country, refresh=False, stale_days=None):
+    stale_before = None
+    if stale_days is not None:
+        stale_before = (datetime.now(timezone.utc) - timedelta(days=stale_days)).isoformat()
+
+    unsaved_clubs = []
+    competitions = Competition().from_country(country)
+    for competition in competitions:
+        season = competition['seasonID']
+        clubs = competition.get('clubs', [])
+        names = dict(i.values() for i in clubs)
+        ids = set(names.keys())
+        fetched_at = Club().get_fetched_at(*ids)
+        if not refresh:
+            ids = ids - set(fetched_at)
+        elif stale_before:
+            ids = {i for i in ids if (fetched_at.get(i) or '') < stale_before}
+        unsaved_clubs.extend({
+            'club_id': id,
+            'season': season,
+            'name': names[id],
+            'competition': competition['id'],
+            'country': country,
+            'fetched_at': fetched_at.get(id)
+        } for id in ids)
+    return unsaved_clubs
+
+
+def is_unfinished(journal, countries):
+    clubs = journal.find('club', statuses=('pending', 'failed'), country={'$in': list(countries)})
+    return any(i['status'] == 'pending' or i.get('attempts', 0) < MAX_ATTEMPTS for i in clubs)
+
+
+def plan_countries(journal, countries, refresh=False, stale_days=None):
+    # A refresh starts over only once the previous one has finished; until then it resumes like init_db.
+    replan = refresh and not is_unfinished(journal, countries)
     for country in countries:
-        competitions = Competition().from_country(country)
-        for competition in competitions:
-            season = competition['seasonID']
-            clubs = competition.get('clubs', [])
-            names = dict(i.values() for i in clubs)
-            ids = list(names.keys())
-            unsaved = Club().find(*ids)
-            unsaved = [i['id'] for i in unsaved]
-            ids = set(ids) - set(unsaved)
-            if len(ids) != 0:
-                api = API()
-                for id in ids:
-                    try:
-                        response = api.get_club_players(id, season)
-                        Club().save(response)
-                        print(f'Saving for {id} ({names[id]})')
-                        time.sleep(random.random() + 1)
-                    except requests.exceptions.HTTPError as err:
-                        status = int(err.response.status_code)
-                        if status == 404:
-                            print(f'Skipping for {id}')
-                            continue
+        entry = journal.get('country', country)
+        if entry and entry['status'] == 'done' and not replan:
+            continue
+        clubs = get_unsaved_clubs(country, refresh=refresh, stale_days=stale_days)
+        journal.add('club', [(f'{i["club_id"]}/{i["season"]}', i) for i in clubs], reset=replan)
+        journal.mark('country', country, 'done')
+
+
+def save_countries(countries, workers=4, rate=1.0, fresh=False, refresh=False, stale_days=None):
+    refresh = refresh or stale_days is not None
+    api = API()
+    limiter = RateLimiter(rate)
+    journal = Journal(f'{JOURNAL_NAME}:refresh' if refresh else JOURNAL_NAME)
+    if fresh:
+        journal.reset()
+
+    def fetch(id, season, name):
+        limiter.acquire(api.host)
+        return api.get_club_players(id, season)
+
+    def save(job, response):
+        id, _, name = job
+        changes = Club().update(response)
+        print(f'Saving for {id} ({name}), {len(changes)} changes')
+
+    def mark(job, status, error=None):
+        id, season, _ = job
+        journal.mark('club', f'{id}/{season}', status, error=error)
+
+    plan_countries(journal, countries, refresh=refresh, stale_days=stale_days)
+    pending = journal.find('club', statuses=('pending', 'failed'), country={'$in': list(countries)})
+    pending = sorted(pending, key=lambda i: i.get('fetched_at') or '')
+    jobs = [(i['club_id'], i['season'], i['name']) for i in pending]
+    failures = crawl(jobs, fetch, save, workers=workers, progress=Progress(len(jobs), label='clubs'), mark=mark)
+    Player().sync(*countries)
+    print(*[f'{k}/{s}: {v}' for (k, s), v in sorted(journal.summary().items())], sep='\n')
+    return failures
+
+
+COUNTRIES = [
+    'England',
+    'Spain',
+    'Italy',
+    'Germany',
+    'France',
+    'Brazil',
+    'Portugal',
+    'Netherlands',
+    'Turkey',
+    'United States',
+    'Russia',
+    'Belgium',
+    'Mexico',
+    'Argentina',
+    'Greece',
+    'Austria',
+    'Japan',
+    'Switzerland',
+    'Scotland',
+    'Denmark',
+    'Poland',
+    'Ukraine',
+    'Serbia',
+    'Czech Republic',
+    'Colombia',
+    'Norway',
+    'Sweden',
+    'Croatia',
+    'Romania',
+    'Chile',
+    'Korea Republic',
+    'Bulgaria',
+    'Peru',
+    'Hungary',
+    'Uruguay',
+    'Israel',
+    'South Africa',
+    'Cyprus',
+    'Egypt',
+    'Islamic Republic of Iran',
+    'China',
+    'Ecuador',
+    'Bolivia',
+    'Morocco',
+    'Paraguay',
+    'Indonesia',
+    'Slovakia',
+    'Thailand',
+    'Australia',
+    'Tunisia',
+    'Bosnia-Herzegovina',
+    'Venezuela',
+    'Uzbekistan',
+    'Algeria',
+    'Slovenia',
+    'India',
+    'Azerbaijan',
+    'Kazakhstan',
+    'New Zealand',
+    'Belarus',
+    'Albania',
+    'Malaysia',
+    'Latvia',
+    'Costa Rica',
+    'Malta',
+    'Armenia',
+    'North Macedonia',
+    'Georgia',
+    'Vietnam',
+    'Lithuania',
+    'Finland',
+    'Moldova',
+    'Iceland',
+    'Guatemala',
+    'Kosovo',
+    'Hong Kong, China',
+    'Northern Ireland',
+    'Honduras',
+    'Ghana',
+    'Panama',
+    'El Salvador',
+    'Luxembourg',
+    'Andorra',
+    'Republic Of Ireland',
+    'Montenegro',
+    'Tajikistan',
+    'Bangladesh',
+    'Kyrgyz Republic',
+    'Estonia',
+    'Canada',
+    'Oman',
+    'Fiji',
+    'Wales',
+    'Cambodia',
+    'Gibraltar',
+    'Faroe Islands',
+    'San Marino',
+    'Philippines',
+    'Chinese Taipei',
+    'Laos',
+    'Angola',
+    'Myanmar',
+    'Nicaragua',
+    'Nigeria',
+    'Jamaica',
+    'Mozambique'
+]
+
+
+@click.command
+@click.option('--workers', '-w', default=4)
+@click.option('--rate', '-r', default=1.0)
+@click.option('--fresh', is_flag=True)
+@click.option('--refresh', is_flag=True)
+@click.option('--stale-days', type=int)
+@click.argument('countries', nargs=-1)
+def main(countries, workers, rate, fresh, refresh, stale_days):
+    save_countries(countries or COUNTRIES, workers=workers, rate=rate, fresh=fresh, refresh=refresh, stale_days=stale_days)
 
 
 if __name__ == '__main__':
-    countries = [
-        'England',
-        'Spain',
-        'Italy',
-        'Germany',
-        'France',
-        'Brazil',
-        'Portugal',
-        'Netherlands',
-        'Turkey',
-        'United States',
-        'Russia',
-        'Belgium',
-        'Mexico',
-        'Argentina',
-        'Greece',
-        'Austria',
-        'Japan',
-        'Switzerland',
-        'Scotland',
-        'Denmark',
-        'Poland',
-        'Ukraine',
-        'Serbia',
-        'Czech Republic',
-        'Colombia',
-        'Norway',
-        'Sweden',
-        'Croatia',
-        'Romania',
-        'Chile',
-        'Korea Republic',
-        'Bulgaria',
-        'Peru',
-        'Hungary',
-        'Uruguay',
-        'Israel',
-        'South Africa',
-        'Cyprus',
-        'Egypt',
-        'Islamic Republic of Iran',
-        'China',
-        'Ecuador',
-        'Bolivia',
-        'Morocco',
-        'Paraguay',
-        'Indonesia',
-        'Slovakia',
-        'Thailand',
-        'Australia',
-        'Tunisia',
-        'Bosnia-Herzegovina',
-        'Venezuela',
-        'Uzbekistan',
-        'Algeria',
-        'Slovenia',
-        'India',
-        'Azerbaijan',
-        'Kazakhstan',
-        'New Zealand',
-        'Belarus',
-        'Albania',
-        'Malaysia',
-        'Latvia',
-        'Costa Rica',
-        'Malta',
-        'Armenia',
-        'North Macedonia',
-        'Georgia',
-        'Vietnam',
-        'Lithuania',
-        'Finland',
-        'Moldova',
-        'Iceland',
-        'Guatemala',
-        'Kosovo',
-        'Hong Kong, China',
-        'Northern Ireland',
-        'Honduras',
-        'Ghana',
-        'Panama',
-        'El Salvador',
-        'Luxembourg',
-        'Andorra',
-        'Republic Of Ireland',
-        'Montenegro',
-        'Tajikistan',
-        'Bangladesh',
-        'Kyrgyz Republic',
-        'Estonia',
-        'Canada',
-        'Oman',
-        'Fiji',
-        'Wales',
-        'Cambodia',
-        'Gibraltar',
-        'Faroe Islands',
-        'San Marino',
-        'Philippines',
-        'Chinese Taipei',
-        'Laos',
-        'Angola',
-        'Myanmar',
-        'Nicaragua',
-        'Nigeria',
-        'Jamaica',
-        'Mozambique'
-    ]
-    save_countries(countries)
-    
-                    
-
-                
-
-
-
-
-
-    
-    
\ No newline at end of file
+    main()
@@ -0,0 +1,110 @@
+import fotmob
+import http_client
+import refdata
+from crawler import Progress, TokenBucket, crawl
+
+import click
+
+
+def get_league_ids(countries=(), league_ids=()):
+    leagues = refdata.get_leagues()
+    if league_ids:
+        return [i for i in league_ids if i in leagues.ids]
+    if countries:
+        return [k for k, v in leagues.league_country.items() if v in countries]
+    return sorted(leagues.ids)
+
+
+def get_seasons(league, seasons=(), latest=1):
+    if seasons:
+        return [i for i in seasons if i in league['seasons']]
+    return league['seasons'][0:latest]
+
+
+def plan_leagues(league_ids):
+    table = fotmob.get_db()['leagues']
+    leagues = dict((i['id'], i) for i in table.find({'id': {'$in': league_ids}}))
+    return leagues, [(i,) for i in league_ids if i not in leagues]
+
+
+def plan_rounds(leagues, pairs):
+    table = fotmob.get_db()['totw_rounds']
+    query = {'league_id': {'$in': list({i for i, _ in pairs})}, 'season': {'$in': list({i for _, i in pairs})}}
+    rounds = dict(((i['league_id'], i['season']), i) for i in table.find(query) if (i['league_id'], i['season']) in pairs)
+    jobs = []
+    for league_id, season in pairs:
+        if (league_id, season) not in rounds:
+            if link := fotmob.get_totw_rounds_link(leagues[league_id], season):
+                jobs.append((link, league_id, season))
+    return rounds, jobs
+
+
+def plan_teams(rounds):
+    table = fotmob.get_db()['totw_team']
+    query = {'league_id': {'$in': list({i for i, _ in rounds})}, 'season': {'$in': list({i for _, i in rounds})}}
+    saved = {(i['league_id'], i['season'], i['round_id']) for i in table.find(query, {'league_id': 1, 'season': 1, 'round_id': 1})}
+    return [
+        (i['link'], league_id, season, i['roundId'])
+        for (league_id, season), totw_rounds in rounds.items()
+        for i in totw_rounds['rounds']
+        if (league_id, season, i['roundId']) not in saved
+    ]
+
+
+def backfill(league_ids, seasons=(), latest=1, workers=4, rate=2.0):
+    api = fotmob.API()
+    db = fotmob.get_db()
+    # One budget for every stage and host, so the whole job stays under `rate` requests per second.
+    limiter = TokenBucket(rate)
+    failures = {}
+
+    leagues, jobs = plan_leagues(league_ids)
+
+    def fetch_league(league_id):
+        limiter.acquire()
+        return api.get_league(league_id)
+
+    def save_league(job, response):
+        league = fotmob.make_league(job[0], response)
+        db['leagues'].replace_one({'id': job[0]}, league, upsert=True)
+        leagues[job[0]] = league
+
+    failures['leagues'] = crawl(jobs, fetch_league, save_league, workers=workers, progress=Progress(len(jobs), label='leagues'))
+
+    pairs = {(i, j) for i in league_ids if i in leagues for j in get_seasons(leagues[i], seasons=seasons, latest=latest)}
+    rounds, jobs = plan_rounds(leagues, pairs)
+
+    def fetch_rounds(link, *_):
+        limiter.acquire()
+        return http_client.get(link)
+
+    def save_rounds(job, response):
+        _, league_id, season = job
+        query = {'league_id': league_id, 'season': season}
+        totw_rounds = {**query, 'rounds': response['rounds']}
+        db['totw_rounds'].replace_one(query, totw_rounds, upsert=True)
+        rounds[(league_id, season)] = totw_rounds
+
+    failures['totw_rounds'] = crawl(jobs, fetch_rounds, save_rounds, workers=workers, progress=Progress(len(jobs), label='seasons'))
+
+    jobs = plan_teams(rounds)
+    failures['totw_team'] = fotmob.fetch_totw_teams(jobs, workers=workers, limiter=limiter)
+    return failures
+
+
+@click.command
+@click.option('--league', '-l', 'league_ids', multiple=True, type=int)
+@click.option('--season', '-s', 'seasons', multiple=True)
+@click.option('--latest', default=1)
+@click.option('--workers', '-w', default=4)
+@click.option('--rate', '-r', default=2.0)
+@click.argument('countries', nargs=-1)
+def main(countries, league_ids, seasons, latest, workers, rate):
+    fotmob.get_all_leagues()
+    league_ids = get_league_ids(countries=countries, league_ids=league_ids)
+    failures = backfill(league_ids, seasons=seasons, latest=latest, workers=workers, rate=rate)
+    print(*[f'{k}: {len(v)} failed' for k, v in failures.items()], sep='\n')
+
+
+if __name__ == '__main__':
+    main()
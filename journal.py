@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+import db
+
+
+class Journal:
+    def __init__(self, name, db_name='transfermarkt'):
+        self.name = name
+        self.table = db.get_db(db_name)['crawl_journal']
+
+    def query(self, kind, key=None, **filters):
+        query = {'journal': self.name, 'kind': kind, **filters}
+        if key is not None:
+            query['key'] = key
+        return query
+
+    def get(self, kind, key):
+        return self.table.find_one(self.query(kind, key))
+
+    def find(self, kind, statuses=None, **filters):
+        query = self.query(kind, **filters)
+        if statuses:
+            query['status'] = {'$in': list(statuses)}
+        return list(self.table.find(query))
+
+    def add(self, kind, items, reset=False):
+        now = datetime.now(timezone.utc).isoformat()
+        ops = []
+        for key, fields in items:
+            if reset:
+                update = {'$set': {'status': 'pending', 'error': None, 'attempts': 0, **fields}, '$setOnInsert': {'createdAt': now}}
+            else:
+                update = {'$setOnInsert': {'status': 'pending', 'attempts': 0, 'createdAt': now, **fields}}
+            ops.append(UpdateOne(self.query(kind, key), update, upsert=True))
+        if ops:
+            self.table.bulk_write(ops, ordered=False)
+
+    def mark(self, kind, key, status, error=None, **fields):
+        update = {'$set': {'status': status, 'error': error, 'updatedAt': datetime.now(timezone.utc).isoformat(), **fields}}
+        if status == 'failed':
+            update['$inc'] = {'attempts': 1}
+        self.table.update_one(self.query(kind, key), update, upsert=True)
+
+    def summary(self):
+        pipeline = [
+            {'$match': {'journal': self.name}},
+            {'$group': {'_id': {'kind': '$kind', 'status': '$status'}, 'count': {'$sum': 1}}}
+        ]
+        return dict(((i['_id']['kind'], i['_id']['status']), i['count']) for i in self.table.aggregate(pipeline))
+
+    def reset(self):
+        self.table.delete_many({'journal': self.name})
@@ -0,0 +1,167 @@
+import fotmob
+import transfermarkt
+from name_index import get_trigrams, normalize
+
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import click
+from pymongo import ReplaceOne
+
+
+CROSSWALK = 'player_crosswalk'
+
+# Keys of a fotmob TOTW player entry.
+FOTMOB_ID = 'participantId'
+FOTMOB_NAME = 'name'
+FOTMOB_TEAM = 'teamName'
+
+CLUB_STOPWORDS = {'fc', 'cf', 'sc', 'ac', 'afc', 'cd', 'sv', 'fk', 'sk', 'as', 'us', 'ss', 'club', 'de', 'the', 'and'}
+MAX_BLOCK = 200
+NAME_WEIGHT = 0.6
+CLUB_WEIGHT = 0.25
+YEAR_WEIGHT = 0.15
+YEAR_PENALTY = 0.3
+THRESHOLD = 0.6
+MARGIN = 0.05
+
+
+def get_club_tokens(club):
+    return {i for i in normalize(club) if i not in CLUB_STOPWORDS and len(i) > 1}
+
+
+def get_birth_year(value):
+    if isinstance(value, dict):
+        value = value.get('utcTime')
+    if value:
+        match = [i for i in str(value).replace(',', ' ').replace('-', ' ').split() if len(i) == 4 and i.isdigit()]
+        if match:
+            return int(match[0])
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0
+    return len(a & b) / len(a | b)
+
+
+def make_candidate(id, name, club, birth_year):
+    tokens = normalize(name)
+    return {
+        'id': id,
+        'name': name,
+        'tokens': tokens,
+        'trigrams': get_trigrams(tokens),
+        'club': get_club_tokens(club),
+        'birth_year': birth_year
+    }
+
+
+def get_blocking_keys(candidate):
+    tokens = candidate['tokens']
+    if not tokens:
+        return []
+    last = tokens[-1]
+    keys = [('name', ' '.join(tokens)), ('last', last)]
+    if candidate['birth_year']:
+        keys.append(('last_year', last, candidate['birth_year']))
+    keys.extend(('last_club', last, i) for i in candidate['club'])
+    return keys
+
+
+class Blocks:
+    def __init__(self, candidates):
+        self.candidates = dict((i['id'], i) for i in candidates)
+        self.blocks = defaultdict(list)
+        for candidate in self.candidates.values():
+            for key in get_blocking_keys(candidate):
+                self.blocks[key].append(candidate['id'])
+
+    def get_candidates(self, candidate):
+        ids = set()
+        for key in get_blocking_keys(candidate):
+            block = self.blocks.get(key, [])
+            # Common surnames make huge blocks; they only count when narrowed by club or birth year.
+            if key[0] == 'last' and len(block) > MAX_BLOCK:
+                continue
+            ids.update(block)
+        return [self.candidates[i] for i in ids]
+
+
+def score(a, b):
+    value = NAME_WEIGHT * jaccard(a['trigrams'], b['trigrams']) + CLUB_WEIGHT * jaccard(a['club'], b['club'])
+    if a['birth_year'] and b['birth_year']:
+        value += YEAR_WEIGHT if a['birth_year'] == b['birth_year'] else -YEAR_PENALTY
+    return value
+
+
+def match(candidate, blocks):
+    scored = sorted(((score(candidate, i), i['id']) for i in blocks.get_candidates(candidate)), reverse=True)
+    if not scored or scored[0][0] < THRESHOLD:
+        return None, scored[0][0] if scored else 0
+    if len(scored) > 1 and scored[0][0] - scored[1][0] < MARGIN:
+        return None, scored[0][0]
+    return scored[0][1], scored[0][0]
+
+
+def get_tm_candidates():
+    fields = {'_id': 0, 'id': 1, 'name': 1, 'club': 1, 'dateOfBirth': 1}
+    for i in transfermarkt.get_db()['players'].find({}, fields):
+        yield make_candidate(i['id'], i.get('name'), i.get('club'), get_birth_year(i.get('dateOfBirth')))
+
+
+def get_fotmob_candidates():
+    players = {}
+    for team in fotmob.get_db()['totw_team'].find({}, {'players': 1}):
+        for i in team['players']:
+            if i.get(FOTMOB_ID) is not None:
+                players[i[FOTMOB_ID]] = i
+    profiles = fotmob.get_db()['players'].find({'id': {'$in': list(players)}}, {'id': 1, 'birthDate': 1})
+    birth_years = dict((i['id'], get_birth_year(i.get('birthDate'))) for i in profiles)
+    return [make_candidate(k, v.get(FOTMOB_NAME), v.get(FOTMOB_TEAM), birth_years.get(k)) for k, v in players.items()]
+
+
+def match_players(rematch=False):
+    table = transfermarkt.get_db()[CROSSWALK]
+    candidates = get_fotmob_candidates()
+    if not rematch:
+        matched = {i['fotmob_id'] for i in table.find({'tm_id': {'$ne': None}}, {'fotmob_id': 1})}
+        candidates = [i for i in candidates if i['id'] not in matched]
+    if not candidates:
+        return []
+
+    blocks = Blocks(get_tm_candidates())
+    matched_at = datetime.now(timezone.utc).isoformat()
+    ops = []
+    results = []
+    for candidate in candidates:
+        tm_id, value = match(candidate, blocks)
+        entry = {
+            'fotmob_id': candidate['id'],
+            'tm_id': tm_id,
+            'name': candidate['name'],
+            'tm_name': blocks.candidates[tm_id]['name'] if tm_id else None,
+            'score': round(value, 4),
+            'matchedAt': matched_at
+        }
+        ops.append(ReplaceOne({'fotmob_id': candidate['id']}, entry, upsert=True))
+        results.append(entry)
+    table.bulk_write(ops, ordered=False)
+    return results
+
+
+@click.command
+@click.option('--rematch', is_flag=True)
+@click.option('--profiles', is_flag=True)
+@click.option('--workers', '-w', default=4)
+@click.option('--rate', '-r', default=2.0)
+def main(rematch, profiles, workers, rate):
+    if profiles:
+        fotmob.sync_player_profiles([i['id'] for i in get_fotmob_candidates()], workers=workers, rate=rate)
+    results = match_players(rematch=rematch)
+    matched = len([i for i in results if i['tm_id']])
+    print(f'Matched {matched} of {len(results)} fotmob players.')
+
+
+if __name__ == '__main__':
+    main()
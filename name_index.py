@@ -0,0 +1,148 @@
+import transfermarkt
+from transfermarkt import Player
+
+import bisect
+import os
+import pickle
+import re
+import threading
+import time
+from collections import defaultdict
+
+import numpy
+from unidecode import unidecode
+
+
+NAME_INDEX = os.environ.get('NAME_INDEX', 'name_index.pkl')
+PREFIX_WEIGHT = 0.5
+SIGNATURE_TTL = 60
+
+_index = None
+_checked = 0
+_lock = threading.Lock()
+
+
+def normalize(text):
+    return re.sub(r'[^a-z0-9 ]+', ' ', unidecode(text or '').lower()).split()
+
+
+def get_trigrams(tokens):
+    trigrams = set()
+    for token in tokens:
+        padded = f'  {token} '
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+class NameIndex:
+    def __init__(self, ids, names, sizes, postings, tokens, token_rows, signature=None):
+        self.ids = ids
+        self.names = names
+        self.sizes = sizes
+        self.postings = postings
+        self.tokens = tokens
+        self.token_rows = token_rows
+        self.signature = signature
+
+    @classmethod
+    def build(cls, rows, signature=None):
+        ids = []
+        names = []
+        sizes = []
+        postings = defaultdict(list)
+        token_map = defaultdict(list)
+        for n, row in enumerate(rows):
+            name = row.get('name_decoded') or row.get('name') or ''
+            tokens = set(normalize(' '.join([name, row.get('first_name') or '', row.get('last_name') or ''])))
+            trigrams = get_trigrams(tokens)
+            for i in trigrams:
+                postings[i].append(n)
+            for i in tokens:
+                token_map[i].append(n)
+            ids.append(row['id'])
+            names.append(name)
+            sizes.append(len(trigrams))
+
+        postings = dict((k, numpy.array(v, dtype=numpy.int32)) for k, v in postings.items())
+        tokens = sorted(token_map)
+        token_rows = [numpy.array(token_map[i], dtype=numpy.int32) for i in tokens]
+        return cls(ids, names, numpy.array(sizes, dtype=numpy.float32), postings, tokens, token_rows, signature)
+
+    def get_prefix_rows(self, prefix):
+        start = bisect.bisect_left(self.tokens, prefix)
+        end = bisect.bisect_left(self.tokens, prefix + '\uffff')
+        if start == end:
+            return None
+        return numpy.concatenate(self.token_rows[start:end])
+
+    def search(self, query, limit=10):
+        tokens = normalize(query)
+        if not tokens or not self.ids:
+            return []
+
+        trigrams = get_trigrams(tokens)
+        hits = [self.postings[i] for i in trigrams if i in self.postings]
+        scores = numpy.zeros(len(self.ids), dtype=numpy.float32)
+        if hits:
+            shared = numpy.bincount(numpy.concatenate(hits), minlength=len(self.ids)).astype(numpy.float32)
+            scores = shared / (len(trigrams) + self.sizes - shared)
+
+        for token in tokens:
+            rows = self.get_prefix_rows(token)
+            if rows is not None:
+                matched = numpy.zeros(len(self.ids), dtype=bool)
+                matched[rows] = True
+                scores += matched * (PREFIX_WEIGHT / len(tokens))
+
+        limit = min(limit, len(self.ids))
+        top = numpy.argpartition(-scores, limit - 1)[:limit]
+        top = top[numpy.argsort(-scores[top], kind='stable')]
+        return [(self.ids[i], self.names[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path=NAME_INDEX):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path=NAME_INDEX):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def get_signature():
+    if players := Player().snapshot:
+        return ('snapshot', players.table.num_rows, os.path.getmtime(os.path.join(players.root, 'players.arrow')))
+    latest = transfermarkt.get_db()['player_sync'].find_one({}, {'syncedAt': 1}, sort=[('syncedAt', -1)])
+    return ('mongo', Player().table.estimated_document_count(), latest and latest.get('syncedAt'))
+
+
+def get_rows():
+    fields = ['id', 'name', 'name_decoded', 'first_name', 'last_name']
+    if players := Player().snapshot:
+        return players.table.select(fields).to_pylist()
+    return Player().table.find({}, dict([('_id', 0)] + [(i, 1) for i in fields]))
+
+
+def get_name_index(rebuild=False, path=NAME_INDEX):
+    global _index, _checked
+    with _lock:
+        # Checking the signature costs database round trips, so do it at most once per SIGNATURE_TTL.
+        if not rebuild and _index is not None and time.monotonic() - _checked < SIGNATURE_TTL:
+            return _index
+
+        signature = get_signature()
+        _checked = time.monotonic()
+        if not rebuild and _index is None and os.path.exists(path):
+            _index = NameIndex.load(path)
+        if rebuild or _index is None or _index.signature != signature:
+            _index = NameIndex.build(get_rows(), signature=signature)
+            _index.save(path)
+    return _index
+
+
+def search_names(query, limit=10):
+    results = get_name_index().search(query, limit=limit)
+    if not results:
+        return []
+    players = dict((i['id'], i) for i in Player().find(*[i[0] for i in results]) if i)
+    return [{**players.get(id, {'id': id, 'name': name}), 'score': score} for id, name, score in results]
@@ -0,0 +1,100 @@
+import csv
+import json
+import sys
+from itertools import islice
+
+import click
+
+
+FORMATS = ['table', 'csv', 'jsonl', 'parquet']
+
+PLAYER_FIELDS = [
+    'id',
+    'name',
+    'age',
+    'nationality',
+    'position',
+    'club',
+    'club_id',
+    'competition_id',
+    'marketValue',
+    'market_value_number',
+    'height',
+    'foot'
+]
+
+PARQUET_TYPES = {
+    'age': 'int64',
+    'market_value_number': 'float64',
+    'market_value': 'float64',
+    'players': 'int64'
+}
+
+CHUNK_SIZE = 10000
+
+
+def get_value(row, field):
+    value = row.get(field)
+    if isinstance(value, (list, tuple)):
+        return '/'.join(str(i) for i in value)
+    return value
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def write_csv(rows, fields, out):
+    writer = csv.writer(out)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([get_value(row, f) for f in fields])
+
+
+def write_jsonl(rows, fields, out):
+    for row in rows:
+        row = dict((f, row.get(f)) for f in fields)
+        out.write(json.dumps(row, default=str) + '\n')
+
+
+def write_parquet(rows, fields, out):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise click.ClickException('Parquet output requires pyarrow (pip install pyarrow).')
+
+    types = [getattr(pyarrow, PARQUET_TYPES.get(f, 'string'))() for f in fields]
+    schema = pyarrow.schema(list(zip(fields, types)))
+    with pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(out.buffer, mode='w'), schema) as writer:
+        for chunk in chunked(rows, CHUNK_SIZE):
+            columns = []
+            for field, type in zip(fields, types):
+                values = [get_value(i, field) for i in chunk]
+                if type == pyarrow.string():
+                    values = [None if v is None else str(v) for v in values]
+                columns.append(pyarrow.array(values, type=type))
+            writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+
+
+WRITERS = {
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+    'parquet': write_parquet
+}
+
+
+def write_rows(rows, format, fields=PLAYER_FIELDS, out=None):
+    WRITERS[format](rows, fields, out or sys.stdout)
+
+
+def with_partition(groups, partition):
+    for bucket, rows in groups.items():
+        for row in rows:
+            yield {partition: bucket, **row}
+
+
+def get_partition_fields(partition, fields=PLAYER_FIELDS):
+    return [partition, *[f for f in fields if f != partition]]
@@ -0,0 +1,62 @@
+import json
+import os
+import threading
+
+
+COUNTRIES_FILE = 'countries.json'
+LEAGUES_FILE = 'leagues.json'
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def load(path, build):
+    mtime = os.stat(path).st_mtime_ns
+    entry = _cache.get(path)
+    if entry is None or entry[0] != mtime:
+        with _lock:
+            entry = _cache.get(path)
+            if entry is None or entry[0] != mtime:
+                with open(path) as f:
+                    entry = (mtime, build(json.load(f)))
+                _cache[path] = entry
+    return entry[1]
+
+
+def flatten_competitions(competitions):
+    flattened = []
+    for c in competitions:
+        if isinstance(c, list):
+            flattened.extend(c)
+        if isinstance(c, str):
+            flattened.append(c)
+    return flattened
+
+
+class Countries:
+    def __init__(self, countries):
+        self.all = countries
+        self.by_name = dict((i['name'], i) for i in countries)
+        self.by_code = dict((i['code'], i) for i in countries)
+        self.by_tm_name = dict((i['transfermarkt_name'], i) for i in countries)
+        self.tm_codes = dict((i['transfermarkt_name'], i['code']) for i in countries)
+        self.competitions = dict(
+            (i['name'], flatten_competitions(i['competitions'] + i['youth_competitions'])) for i in countries
+        )
+        self.competition_country = dict((c, k) for k, v in self.competitions.items() for c in v)
+
+
+class Leagues:
+    def __init__(self, leagues):
+        self.all = leagues
+        self.by_id = dict((j['id'], j) for i in leagues for j in i['leagues'])
+        self.ids = set(self.by_id)
+        self.league_country = dict((j['id'], i['name']) for i in leagues for j in i['leagues'])
+
+
+def get_countries():
+    return load(COUNTRIES_FILE, Countries)
+
+
+def get_leagues():
+    return load(LEAGUES_FILE, Leagues)
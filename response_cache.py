@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+DEFAULT_TTL = HOUR
+
+TTLS = [
+    (r'/clubs/[^/]+/players', DAY),
+    (r'/competitions/[^/]+/clubs', 7 * DAY),
+    (r'/players/[^/]+/(profile|stats)', DAY),
+    (r'/players/search/', DAY),
+    (r'fotmob\.com/api/allLeagues', 7 * DAY),
+    (r'fotmob\.com/api/leagues', DAY),
+    (r'fotmob\.com/api/fixtures', HOUR),
+    (r'fotmob\.com/api/playerData', DAY)
+]
+
+MAX_SIZE = int(os.environ.get('HTTP_CACHE_MAX_SIZE', 512 * 1024 * 1024))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+'''
+
+
+def make_key(url, params=None):
+    params = sorted((str(k), str(v)) for k, v in (params or {}).items())
+    return hashlib.sha256(json.dumps([url, params]).encode()).hexdigest()
+
+
+class Entry:
+    def __init__(self, body, etag, last_modified, expires_at):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires_at
+
+    def json(self):
+        return json.loads(self.body)
+
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    def __init__(self, path, ttls=TTLS, default_ttl=DEFAULT_TTL, max_size=MAX_SIZE):
+        self.path = path
+        self.ttls = [(re.compile(p), t) for p, t in ttls]
+        self.default_ttl = default_ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def get_ttl(self, url):
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def get(self, url, params=None):
+        key = make_key(url, params)
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT body, etag, last_modified, expires_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row:
+                self.conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+                return Entry(*row)
+
+    def put(self, url, params, response):
+        key = make_key(url, params)
+        now = time.time()
+        body = response.content
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, url, body, etag, last_modified, now + self.get_ttl(url), now, len(body))
+            )
+            self.evict()
+
+    def refresh(self, url, params):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'UPDATE responses SET expires_at = ?, accessed_at = ? WHERE key = ?',
+                (now + self.get_ttl(url), now, make_key(url, params))
+            )
+
+    def evict(self):
+        total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = self.conn.execute('SELECT key, size FROM responses ORDER BY accessed_at').fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            stale.append((key,))
+            total -= size
+        self.conn.executemany('DELETE FROM responses WHERE key = ?', stale)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM responses')
+
+
+_default = None
+_lock = threading.Lock()
+
+
+def get_default():
+    global _default
+    path = os.environ.get('HTTP_CACHE')
+    if path and _default is None:
+        with _lock:
+            if _default is None:
+                _default = ResponseCache(path)
+    return _default
@@ -1,3 +1,6 @@
+import numpy
+
+
 def convert_price_string(ps):
     value = ps.strip('€')
     suffix = value[-1]
@@ -28,3 +31,21 @@ def get_years_and_months(d1, d2):
             months = 11
 
     return years, months
+
+
+def get_years_and_months_array(d1, d2):
+    d1 = numpy.asarray(d1, dtype=numpy.int64).reshape(-1, 3)
+    d2 = numpy.asarray(d2, dtype=numpy.int64).reshape(-1, 3)
+    k1 = d1 @ numpy.array([10000, 100, 1])
+    k2 = d2 @ numpy.array([10000, 100, 1])
+    swap = (k1 > k2)[:, None]
+    d1, d2 = numpy.where(swap, d2, d1), numpy.where(swap, d1, d2)
+    (y1, m1, a1), (y2, m2, a2) = d1.T, d2.T
+
+    years = y2 - y1 - ((m2 < m1) | ((m2 == m1) & (a2 < a1)))
+
+    months = m2 - m1
+    months = numpy.where(months < 0, months + 12, months)
+    months = numpy.where(a2 < a1, numpy.where(months == 0, 11, months - 1), months)
+
+    return years, months
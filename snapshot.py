@@ -0,0 +1,131 @@
+import glob
+import os
+import threading
+
+import numpy
+import pyarrow
+import pyarrow.compute
+import pyarrow.dataset
+import pyarrow.ipc
+from unidecode import unidecode
+
+
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'snapshot')
+
+_snapshots = {}
+_lock = threading.Lock()
+
+
+def get_mtime(paths):
+    return max([os.path.getmtime(i) for i in paths] or [0])
+
+
+def get_order(column, reverse=False):
+    values = pyarrow.compute.cast(column, pyarrow.float64()).to_numpy(zero_copy_only=False)
+    # NaN (missing) sorts last in both directions, like a Mongo descending sort.
+    return numpy.argsort(-values if reverse else values, kind='stable').astype(numpy.int64)
+
+
+def build(root, dataset):
+    table = pyarrow.dataset.dataset(
+        os.path.join(root, dataset), format='parquet', partitioning='hive'
+    ).to_table()
+    table = table.unify_dictionaries().combine_chunks()
+
+    path = os.path.join(root, f'{dataset}.arrow')
+    with pyarrow.OSFile(path, 'wb') as sink:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    if 'market_value_number' in table.column_names:
+        numpy.save(os.path.join(root, f'{dataset}.market_value_number.npy'), get_order(table['market_value_number'], reverse=True))
+    if 'age' in table.column_names:
+        numpy.save(os.path.join(root, f'{dataset}.age.npy'), get_order(table['age']))
+
+
+OPERATORS = {
+    '$in': lambda column, arg: pyarrow.compute.is_in(column, value_set=pyarrow.array(list(arg), type=column.type)),
+    '$lte': lambda column, arg: pyarrow.compute.less_equal(column, arg),
+    '$gte': lambda column, arg: pyarrow.compute.greater_equal(column, arg)
+}
+
+
+class Snapshot:
+    def __init__(self, root, dataset):
+        self.root = root
+        self.dataset = dataset
+        path = os.path.join(root, f'{dataset}.arrow')
+        parts = glob.glob(os.path.join(root, dataset, '**', '*.parquet'), recursive=True)
+        if not os.path.exists(path) or os.path.getmtime(path) < get_mtime(parts):
+            build(root, dataset)
+
+        self.table = pyarrow.ipc.open_file(pyarrow.memory_map(path)).read_all()
+        self.orders = {}
+        for field, direction in (('market_value_number', -1), ('age', 1)):
+            order_path = os.path.join(root, f'{dataset}.{field}.npy')
+            if os.path.exists(order_path):
+                self.orders[(field, direction)] = numpy.load(order_path, mmap_mode='r')
+
+    def get_column(self, field):
+        column = self.table[field]
+        if pyarrow.types.is_dictionary(column.type):
+            column = column.cast(column.type.value_type)
+        return column
+
+    def get_mask(self, query):
+        mask = numpy.ones(self.table.num_rows, dtype=bool)
+        for field, conditions in query.items():
+            if field not in self.table.column_names:
+                return numpy.zeros(self.table.num_rows, dtype=bool)
+            column = self.get_column(field)
+            for op, arg in conditions.items():
+                mask &= OPERATORS[op](column, arg).fill_null(False).to_numpy()
+        return mask
+
+    def get_rows(self, indices, fields=None):
+        table = self.table
+        if fields:
+            table = table.select([i for i in fields if i in table.column_names])
+        return table.take(pyarrow.array(indices, type=pyarrow.int64())).to_pylist()
+
+    def search(self, query, sort_by=None, limit=None, fields=None):
+        mask = self.get_mask(query)
+        if sort_by:
+            order = self.orders.get(tuple(sort_by))
+            if order is None:
+                field, direction = sort_by
+                order = get_order(self.table[field], reverse=direction < 0)
+            indices = order[mask[order]]
+        else:
+            indices = numpy.flatnonzero(mask)
+
+        if limit:
+            indices = indices[0:limit]
+        return self.get_rows(indices, fields=fields)
+
+    def find(self, *ids):
+        return self.search({'id': {'$in': list(ids)}})
+
+    def search_by_name(self, name):
+        name = unidecode(name).lower()
+        names = pyarrow.compute.utf8_lower(self.get_column('name_decoded'))
+        mask = pyarrow.compute.equal(names, name).fill_null(False).to_numpy(zero_copy_only=False)
+        return self.get_rows(numpy.flatnonzero(mask))
+
+    def group_sum(self, key, field, positive=False):
+        table = self.table.select([key, field])
+        table = table.set_column(0, key, self.get_column(key))
+        if positive:
+            table = table.filter(pyarrow.compute.greater(table[field], 0))
+        grouped = table.group_by(key).aggregate([(field, 'sum'), (field, 'count')])
+        return grouped.to_pylist()
+
+
+def get_snapshot(dataset, root=None):
+    root = root or SNAPSHOT_DIR
+    key = (root, dataset)
+    if key not in _snapshots:
+        with _lock:
+            if key not in _snapshots:
+                _snapshots[key] = Snapshot(root, dataset)
+    return _snapshots[key]
@@ -1,98 +1,176 @@
 import codes
+import db
+import http_client
+import refdata
 import shared
+from indexes import NAME_COLLATION
 
+import hashlib
 import json
+import os
 import re
-from datetime import datetime
+from datetime import date, datetime, timezone
+from functools import lru_cache
 from itertools import chain
 
-import requests
+import numpy
+
+from pymongo import ReplaceOne
 from unidecode import unidecode
-from pymongo import MongoClient
 
 
 DB_NAME = 'transfermarkt'
+BATCH_SIZE = int(os.environ.get('MONGO_BATCH_SIZE', 1000))
+FORMAT_VERSION = 1
+BACKEND = os.environ.get('DATA_BACKEND', 'mongo')
+SNAPSHOT_DATASETS = ('players', 'clubs')
+
+
+def get_db():
+    return db.get_db(DB_NAME)
+
+
+decode = lru_cache(maxsize=None)(unidecode)
+convert_price_string = lru_cache(maxsize=None)(shared.convert_price_string)
+
+
+@lru_cache(maxsize=None)
+def parse_date(value):
+    return datetime.strptime(value, '%b %d, %Y').timetuple()[:3]
+
+
+@lru_cache(maxsize=None)
+def parse_isodate(value):
+    return datetime.fromisoformat(value).timetuple()[:3]
 
 
-def get_client():
-    return MongoClient('localhost', 27017)
+@lru_cache(maxsize=None)
+def parse_height(height):
+    height_m = re.search(r'(\d+,\d+)m', height)
+    if height_m:
+        height_m = height_m.group(1).replace(',', '.')
+        height_m = float(height_m)
+        height_cm = height_m * 100
+        height_ft = height_cm / 2.54
+        height_ft /= 12
+        height_in = (height_ft % 1) * 12
+        return int(height_ft), int(height_in)
 
 
 class API:
-    def __init__(self):
+    def __init__(self, timeout=None, cache=None):
         self.host = 'https://transfermarkt-api.vercel.app'
+        self.timeout = timeout
+        self.cache = cache
+
+    def get(self, path, params=None):
+        return http_client.get(f'{self.host}{path}', params=params, timeout=self.timeout, cache=self.cache)
 
     def search_player(self, player_name):
-        response = requests.get(f'{self.host}/players/search/{player_name}')
-        response.raise_for_status()
-        return response.json()
+        return self.get(f'/players/search/{player_name}')
 
     def get_player(self, player_id):
-        response = requests.get(f'{self.host}/players/{player_id}/profile')
-        response.raise_for_status()
-        return response.json()
+        return self.get(f'/players/{player_id}/profile')
     
     def get_player_stats(self, player_id):
-        response = requests.get(f'{self.host}/players/{player_id}/stats')
-        response.raise_for_status()
-        return response.json()
+        return self.get(f'/players/{player_id}/stats')
     
     def get_competition_clubs(self, competition_id, season_id):
-        response = requests.get(f'{self.host}/competitions/{competition_id}/clubs', params={'season_id': season_id})
-        response.raise_for_status()
-        return response.json()
+        return self.get(f'/competitions/{competition_id}/clubs', params={'season_id': season_id})
     
     def get_club_players(self, club_id, season_id):
-        response = requests.get(f'{self.host}/clubs/{club_id}/players', params={'season_id': season_id})
-        response.raise_for_status()
-        return response.json()
+        return self.get(f'/clubs/{club_id}/players', params={'season_id': season_id})
 
 
 class Record:
     def __init__(self, name):
         self.name = name
 
+    @property
+    def table(self):
+        return get_db()[self.name]
+
+    @property
+    def snapshot(self):
+        if BACKEND == 'snapshot' and self.name in SNAPSHOT_DATASETS:
+            # Imported here so pyarrow is only needed with the snapshot backend.
+            import snapshot
+            return snapshot.get_snapshot(self.name)
+
     def find(self, *ids):
-        with get_client() as client:
-            table = client[DB_NAME][self.name]
-            if len(ids) == 1:
-                return [table.find_one({'id': ids[0]})]
-            return list(table.find({'id': {'$in': ids}}))
+        if self.snapshot:
+            return self.snapshot.find(*ids)
+        if len(ids) == 1:
+            return [self.table.find_one({'id': ids[0]})]
+        return list(self.table.find({'id': {'$in': ids}}))
         
-    def save(self, *records):
-        with get_client() as client:
-            table = client[DB_NAME][self.name]
-            if len(records) == 1:
-                table.insert_one(records[0])
-            else:
-                table.insert_many(records)
+    def save(self, *records, batch_size=BATCH_SIZE):
+        records = list(dict((i['id'], dict((k, v) for k, v in i.items() if k != '_id')) for i in records).values())
+        for i in range(0, len(records), batch_size):
+            ops = [ReplaceOne({'id': r['id']}, r, upsert=True) for r in records[i:i + batch_size]]
+            self.table.bulk_write(ops, ordered=False)
             
 
 class Competition(Record):
     def __init__(self):
         super().__init__(name='competitions')
 
+    def ids_from_country(self, name):
+        return list(refdata.get_countries().competitions[name])
+
     def from_country(self, name):
-        countries = None
-        with open('countries.json') as f:
-            countries = json.load(f)
+        return self.find(*self.ids_from_country(name))
+
+
+def get_roster_hash(players):
+    players = sorted(players, key=lambda i: str(i.get('id')))
+    return hashlib.sha256(json.dumps(players, sort_keys=True, default=str).encode()).hexdigest()
 
-        country = [i for i in countries if i['name'] == name][0]
-        
-        competitions = []
-        for c in country['competitions'] + country['youth_competitions']:
-            if isinstance(c, list):
-                competitions.extend(c)
-            if isinstance(c, str):
-                competitions.append(c)
 
-        return self.find(*competitions)
+def diff_rosters(club_id, old, new):
+    detected_at = datetime.now(timezone.utc).isoformat()
+    old = dict((i['id'], i) for i in old)
+    new = dict((i['id'], i) for i in new)
+    changes = []
+    for id in new.keys() - old.keys():
+        changes.append({'club_id': club_id, 'player_id': id, 'type': 'joined', 'name': new[id].get('name'), 'detectedAt': detected_at})
+    for id in old.keys() - new.keys():
+        changes.append({'club_id': club_id, 'player_id': id, 'type': 'left', 'name': old[id].get('name'), 'detectedAt': detected_at})
+    for id in new.keys() & old.keys():
+        keys = set(old[id]) | set(new[id])
+        fields = dict((k, [old[id].get(k), new[id].get(k)]) for k in keys if old[id].get(k) != new[id].get(k))
+        if fields:
+            changes.append({'club_id': club_id, 'player_id': id, 'type': 'changed', 'name': new[id].get('name'), 'fields': fields, 'detectedAt': detected_at})
+    return changes
 
 
 class Club(Record):
     def __init__(self):
         super().__init__(name='clubs')
 
+    def update(self, club):
+        fetched_at = datetime.now(timezone.utc).isoformat()
+        players = club.get('players', [])
+        roster_hash = get_roster_hash(players)
+        previous = self.table.find_one({'id': club['id']}, {'players': 1, 'roster_hash': 1})
+        if previous:
+            previous_hash = previous.get('roster_hash') or get_roster_hash(previous.get('players', []))
+            if previous_hash == roster_hash:
+                self.table.update_one({'id': club['id']}, {'$set': {'fetchedAt': fetched_at}})
+                return []
+
+        self.save({**club, 'roster_hash': roster_hash, 'fetchedAt': fetched_at})
+        changes = []
+        if previous:
+            changes = diff_rosters(club['id'], previous.get('players', []), players)
+            if changes:
+                get_db()['roster_changes'].insert_many(changes)
+        return changes
+
+    def get_fetched_at(self, *ids):
+        clubs = self.table.find({'id': {'$in': list(ids)}}, {'id': 1, 'fetchedAt': 1, 'updatedAt': 1})
+        return dict((i['id'], i.get('fetchedAt') or i.get('updatedAt')) for i in clubs)
+
     def from_country(self, name):
         competitions = Competition().from_country(name)
         if competitions:
@@ -108,23 +186,208 @@ class Club(Record):
             return []
         
 
+def get_ymd(value, parse):
+    if isinstance(value, str):
+        return parse(value)
+    return value.timetuple()[:3]
+
+
+class lazy:
+    def __init__(self, func):
+        self.func = func
+        self.slot = f'_{func.__name__}'
+
+    def __get__(self, row, cls):
+        if row is None:
+            return self
+        try:
+            return getattr(row, self.slot)
+        except AttributeError:
+            value = self.func(row)
+            setattr(row, self.slot, value)
+            return value
+
+
+class PlayerRow:
+    FIELDS = (
+        'id', 'name', 'position', 'age', 'nationality', 'club', 'club_id', 'competition_id',
+        'marketValue', 'market_value_number', 'height', 'foot', 'dateOfBirth', 'joinedOn', 'updated_at'
+    )
+    DERIVED = (
+        'name_decoded', 'first_name', 'last_name', 'club_decoded', 'nationality1', 'nationality2',
+        'age_relative', 'joined_on_relative', 'height_us'
+    )
+    KEYS = FIELDS + DERIVED
+    KEY_SET = frozenset(KEYS)
+    PROJECTION = dict([('_id', 0)] + [(i, 1) for i in FIELDS])
+    # Snapshot rows keep the roster dates under their parquet column names.
+    ALIASES = {'dateOfBirth': 'date_of_birth', 'joinedOn': 'joined_on'}
+    SNAPSHOT_FIELDS = FIELDS + tuple(ALIASES.values())
+
+    __slots__ = FIELDS + tuple(f'_{i}' for i in DERIVED)
+
+    def __init__(self, *values):
+        for k, v in zip(self.FIELDS, values):
+            setattr(self, k, v)
+
+    @classmethod
+    def from_doc(cls, doc):
+        return cls(*[doc.get(k, doc.get(cls.ALIASES.get(k))) for k in cls.FIELDS])
+
+    @lazy
+    def name_decoded(self):
+        return decode(self.name) if self.name else None
+
+    @lazy
+    def first_name(self):
+        return self.name_decoded.split(' ')[0] if self.name_decoded else None
+
+    @lazy
+    def last_name(self):
+        return self.name_decoded.split(' ')[-1] if self.name_decoded else None
+
+    @lazy
+    def club_decoded(self):
+        return decode(self.club) if self.club else None
+
+    @lazy
+    def nationality1(self):
+        return self.nationality[0] if self.nationality else None
+
+    @lazy
+    def nationality2(self):
+        return self.nationality[1] if self.nationality and len(self.nationality) > 1 else None
+
+    def get_relative(self, value):
+        if value and self.updated_at:
+            d1 = date(*get_ymd(value, parse_date))
+            d2 = date(*get_ymd(self.updated_at, parse_isodate))
+            return list(shared.get_years_and_months(d1, d2))
+
+    @lazy
+    def age_relative(self):
+        return self.get_relative(self.dateOfBirth)
+
+    @lazy
+    def joined_on_relative(self):
+        return self.get_relative(self.joinedOn)
+
+    @lazy
+    def height_us(self):
+        if self.height and (height_us := parse_height(self.height)):
+            return list(height_us)
+
+    def get(self, key, default=None):
+        value = getattr(self, key) if key in self.KEY_SET else None
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def keys(self):
+        return [k for k in self.KEYS if self.get(k) is not None]
+
+    def items(self):
+        return [(k, getattr(self, k)) for k in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __repr__(self):
+        return f'PlayerRow({self.id!r}, {self.name!r})'
+
+
 class Player(Record):
     def __init__(self):
         super().__init__(name='players')
 
+    def rows(self, competitions, clubs=None):
+        pipeline = [
+            {'$match': {'id': {'$in': competitions}}},
+            {'$unwind': '$clubs'}
+        ]
+        if clubs is not None:
+            pipeline.append({'$match': {'clubs.id': {'$in': clubs}}})
+        pipeline.extend([
+            {'$lookup': {
+                'from': 'clubs',
+                'localField': 'clubs.id',
+                'foreignField': 'id',
+                'pipeline': [{'$project': {'_id': 0, 'updatedAt': 1, 'players': 1}}],
+                'as': 'roster'
+            }},
+            {'$unwind': '$roster'},
+            {'$unwind': '$roster.players'},
+            {'$replaceRoot': {'newRoot': {'$mergeObjects': [
+                {
+                    'club': '$clubs.name',
+                    'club_id': '$clubs.id',
+                    'competition_id': '$id',
+                    'updated_at': '$roster.updatedAt'
+                },
+                '$roster.players'
+            ]}}}
+        ])
+        return get_db()['competitions'].aggregate(pipeline)
+
     def from_country(self, name):
-        clubs = Club().from_country(name)
-        players = []
-        if clubs:
-            for i in clubs:
-                club = i['club']
-                club_id = i['club_id']
-                updated_at = i['updatedAt']
-                players.extend([{'club': club, 'club_id': club_id, 'updated_at': updated_at, **j} for j in i.get('players', [])])
-        return [self.format_row(i) for i in players]
+        if self.snapshot:
+            rows = self.snapshot.search({'country': {'$in': [name]}}, fields=PlayerRow.SNAPSHOT_FIELDS)
+        else:
+            competitions = Competition().ids_from_country(name)
+            rows = self.table.find({'competition_id': {'$in': competitions}}, PlayerRow.PROJECTION)
+        return [PlayerRow.from_doc(i) for i in rows]
+
+    def get_stale_clubs(self, competitions):
+        competitions = get_db()['competitions'].find({'id': {'$in': competitions}}, {'clubs.id': 1})
+        ids = list({j['id'] for i in competitions for j in i.get('clubs', [])})
+        clubs = Club().table.find({'id': {'$in': ids}}, {'id': 1, 'updatedAt': 1})
+        synced = get_db()['player_sync'].find({'club_id': {'$in': ids}})
+        synced = dict((i['club_id'], (i['updatedAt'], i['format_version'])) for i in synced)
+        return dict((i['id'], i.get('updatedAt')) for i in clubs if synced.get(i['id']) != (i.get('updatedAt'), FORMAT_VERSION))
+
+    def sync(self, *names):
+        if names:
+            competitions = list(chain(*[Competition().ids_from_country(i) for i in names]))
+        else:
+            competitions = [i['id'] for i in Competition().table.find({}, {'id': 1})]
+
+        clubs = self.get_stale_clubs(competitions)
+        if len(clubs) != 0:
+            players = self.format_rows(self.rows(competitions, clubs=list(clubs)))
+            existing = self.table.find({'club_id': {'$in': list(clubs)}}, {'_id': 0, 'updated_at': 0})
+            existing = dict((i['id'], i) for i in existing)
+            changed = [i for i in players if existing.get(i['id']) != dict((k, v) for k, v in i.items() if k != 'updated_at')]
+            print(f'Syncing {len(changed)} of {len(players)} players from {len(clubs)} clubs.')
+            if changed:
+                self.save(*changed)
+            self.table.delete_many({'club_id': {'$in': list(clubs)}, 'id': {'$nin': [i['id'] for i in players]}})
+
+            synced_at = datetime.now(timezone.utc).isoformat()
+            ops = [
+                ReplaceOne(
+                    {'club_id': k},
+                    {'club_id': k, 'updatedAt': v, 'format_version': FORMAT_VERSION, 'syncedAt': synced_at},
+                    upsert=True
+                )
+                for k, v in clubs.items()
+            ]
+            get_db()['player_sync'].bulk_write(ops, ordered=False)
+
+            changed = Competition().table.find({'id': {'$in': competitions}, 'clubs.id': {'$in': list(clubs)}}, {'id': 1})
+            competition_country = refdata.get_countries().competition_country
+            CountryStats().refresh(*{competition_country[i['id']] for i in changed if i['id'] in competition_country})
+        return clubs
 
     def format_row(self, row):
         formatted = dict((k, v) for k, v in row.items())
+        formatted['format_version'] = FORMAT_VERSION
         updated_at = datetime.fromisoformat(formatted['updated_at'])
         name_decoded = unidecode(formatted['name'])
         formatted['name_decoded'] = name_decoded
@@ -145,12 +408,12 @@ class Player(Record):
 
         if joined_on := formatted.get('joinedOn'):
             joined_on = datetime.strptime(joined_on, '%b %d, %Y')
-            joined_on_relative = shared.get_years_and_months(joined_on, updated_at)
+            joined_on_relative = list(shared.get_years_and_months(joined_on, updated_at))
             formatted['joined_on_relative'] = joined_on_relative
 
         if date_of_birth := formatted.get('dateOfBirth'):
             date_of_birth = datetime.strptime(date_of_birth, '%b %d, %Y')
-            age_relative = shared.get_years_and_months(date_of_birth, updated_at)
+            age_relative = list(shared.get_years_and_months(date_of_birth, updated_at))
             formatted['age_relative'] = age_relative
             formatted['age'] = age_relative[0]
 
@@ -167,18 +430,90 @@ class Player(Record):
 
         return formatted
 
+    def format_rows(self, rows):
+        formatted = [dict((k, v) for k, v in i.items()) for i in rows]
+        if len(formatted) == 0:
+            return formatted
+
+        for row in formatted:
+            row['format_version'] = FORMAT_VERSION
+            name_decoded = decode(row['name'])
+            row['name_decoded'] = name_decoded
+            names = name_decoded.split(' ')
+            row['last_name'] = names[-1]
+            row['first_name'] = names[0]
+
+            if club := row.get('club'):
+                row['club_decoded'] = decode(club)
+
+            if market_value := row.get('marketValue'):
+                row['market_value_number'] = convert_price_string(market_value)
+
+            if nationality := row.get('nationality'):
+                row['nationality1'] = nationality[0]
+                if len(nationality) > 1:
+                    row['nationality2'] = nationality[1]
+
+        updated_at = numpy.array([parse_isodate(i['updated_at']) for i in formatted])
+        for key, field in (('joinedOn', 'joined_on_relative'), ('dateOfBirth', 'age_relative')):
+            index = [n for n, i in enumerate(formatted) if i.get(key)]
+            if index:
+                dates = numpy.array([parse_date(formatted[n][key]) for n in index])
+                years, months = shared.get_years_and_months_array(dates, updated_at[index])
+                for n, y, m in zip(index, years.tolist(), months.tolist()):
+                    # Lists, not tuples, so rows compare equal to what Mongo hands back in sync.
+                    formatted[n][field] = [y, m]
+                    if field == 'age_relative':
+                        formatted[n]['age'] = y
+
+        for row in formatted:
+            if height := row.get('height'):
+                if height_us := parse_height(height):
+                    row['height_us'] = list(height_us)
+
+        return formatted
+
     def save_country(self, name):
-        players = self.from_country(name)
-        ids = {i['id'] for i in players}
-        result = self.find(*list(ids))
-        ids = ids - {i['id'] for i in result}
-        if len(ids) != 0:
-            print(f'Saving {len(ids)} players.')
-            players = [i for i in players if i['id'] in ids]
-            self.save(*players)
+        return self.sync(name)
 
-    
-def search_players(sort_by=('market_value_number', -1), limit=None, **filters):
+
+
+class CountryStats(Record):
+    def __init__(self):
+        super().__init__(name='country_stats')
+
+    def all(self):
+        if players := Player().snapshot:
+            return [
+                {'id': i['country'], 'market_value': i['market_value_number_sum'] or 0, 'players': i['market_value_number_count']}
+                for i in players.group_sum('country', 'market_value_number', positive=True)
+            ]
+        return list(self.table.find({}, {'_id': 0}))
+
+    def refresh(self, *names):
+        if Player().snapshot:
+            return self.all()
+
+        countries = refdata.get_countries()
+        names = names or [i['name'] for i in countries.all if i['competitions']]
+        competitions = list(chain(*[countries.competitions[i] for i in names]))
+        pipeline = [
+            {'$match': {'competition_id': {'$in': competitions}, 'market_value_number': {'$gt': 0}}},
+            {'$group': {'_id': '$competition_id', 'market_value': {'$sum': '$market_value_number'}, 'players': {'$sum': 1}}}
+        ]
+        stats = dict((i, {'id': i, 'market_value': 0, 'players': 0}) for i in names)
+        for i in Player().table.aggregate(pipeline):
+            country = stats[countries.competition_country[i['_id']]]
+            country['market_value'] += i['market_value']
+            country['players'] += i['players']
+
+        stats = list(stats.values())
+        if len(stats) != 0:
+            self.save(*stats)
+        return stats
+
+
+def get_query(**filters):
     query = {}
     
     age_max = filters.get('age_max')
@@ -209,38 +544,48 @@ def search_players(sort_by=('market_value_number', -1), limit=None, **filters):
     if clubs:
         query['club_id'] = {'$in': clubs}
 
+    countries = filters.get('countries')
+    if countries:
+        query['competition_id'] = {'$in': list(chain(*[Competition().ids_from_country(i) for i in countries]))}
+
+    return query
+
+
+def search_players(sort_by=('market_value_number', -1), limit=None, stream=False, **filters):
+    query = get_query(**filters)
+
     results = None
     if query:
-        with get_client() as client:
-            db = client[DB_NAME]
-            table = db['players']
-            results = table.find(query)
-            if sort_by:
-                results = results.sort(*sort_by)
+        if players := Player().snapshot:
+            if stream:
+                return players.search(query, sort_by=sort_by, limit=limit)
+            rows = players.search(query, sort_by=sort_by, limit=limit, fields=PlayerRow.SNAPSHOT_FIELDS)
+            return [PlayerRow.from_doc(i) for i in rows]
 
-            if limit:
-                results = results.limit(limit)
+        results = get_db()['players'].find(query, None if stream else PlayerRow.PROJECTION)
+        if sort_by:
+            results = results.sort(*sort_by)
 
-            results = list(results)
+        if limit:
+            results = results.limit(limit)
+
+        if not stream:
+            results = [PlayerRow.from_doc(i) for i in results]
 
     return results
 
 
 def save_countries():
-    with open('countries.json') as f:
-        countries = json.load(f)
-    
-    for i in countries:
+    for i in refdata.get_countries().all:
         name = i['name']
         Player().save_country(name)
 
 
 def search_by_name(name):
+    if players := Player().snapshot:
+        return players.search_by_name(name)
     name = unidecode(name)
-    with get_client() as client:
-        db = client[DB_NAME]
-        table = db['players']
-        return list(table.find({'name_decoded': name}))
+    return list(get_db()['players'].find({'name_decoded': name}, collation=NAME_COLLATION))
 
 
 class Query: